@@ -9,10 +9,16 @@ from flask_login import LoginManager
 from flasgger import Swagger
 from main.main import main
 from auth.auth import auth
+from auth.usercache import user_cache
 from streamer.streamer import streamer
 from viewer.viewer import viewer
 from oauth.oauth import oauth
 from wowza.wowza import wowza
+from wowza.reconciler import stream_reconciler
+from wowza.warmpool import warm_stream_pool
+from wowza.persistence import stream_persister
+from wowza.reaper import stream_reaper
+from wowza.demand import viewer_demand
 
 app = Flask(__name__)
 CORS(app)
@@ -34,6 +40,18 @@ login_manager.init_app(app)
 login_manager.login_view = 'auth.login_get'
 
 
+def start_background_jobs(app: Flask):
+    # called once per serving worker by the gunicorn hook in gunicorn.conf.py, never on import, so cli commands like
+    # `flask migrate upgrade` neither read the stream table before it exists nor start talking to wowza
+    with app.app_context():
+        stream_persister.rehydrate()
+    stream_persister.start(app)
+    stream_reconciler.start()
+    warm_stream_pool.start()
+    stream_reaper.start()
+    viewer_demand.start()
+
+
 @app.context_processor
 def inject_globals():
     return {'footer_data': footer_data}
@@ -41,7 +59,7 @@ def inject_globals():
 
 @login_manager.user_loader
 def load_user(username):
-    return db.session.execute(db.select(User).where(User.id == username)).scalar()
+    return user_cache.get(username, lambda: db.session.execute(db.select(User).where(User.id == username)).scalar())
 
 @app.errorhandler(401)
 def unauthorized(error):
@@ -6,6 +6,7 @@ from flask import Blueprint, url_for, redirect, session, render_template
 from flask_login import login_user, logout_user,current_user
 from oauth.twitchclass import TwitchUserService, extract_twitch_info, OauthFacade
 from models import User,db
+from auth.usercache import user_cache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -42,6 +43,17 @@ def _login_user():
     existing_user = db.session.execute(db.select(User).filter_by(id=user_id)).scalar_one_or_none()
 
     if existing_user:
+        # keep the stored profile and token in step with twitch, and drop every worker's cached copy of the user
+        existing_user.username = username
+        existing_user.email = email
+        existing_user.token_data = json.dumps(oauth_data)
+        existing_user.profile_image_url = profile_image_url
+        try:
+            db.session.commit()
+        except SQLAlchemyError as e:
+            logger.error(f"Database error while updating user {user_id}: {e}")
+            db.session.rollback()
+        user_cache.invalidate(existing_user.id)
         login_user(existing_user)
         session.permanent = True
         logger.info(f"User logged in: {existing_user.username}")
@@ -0,0 +1,75 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from models import User
+from cache import CacheBackend, get_cache
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+user_cache_namespace = 'session-users'
+# oauth tokens never leave the database, User.access_token loads them for the requests that call twitch
+token_fields = ('token_data',)
+
+
+def user_fields(user: User) -> dict:
+    return {column.key: getattr(user, column.key) for column in User.__table__.columns
+            if column.key not in token_fields}
+
+
+class UserCache:
+    # the logged in user of every request, without a database query per request
+    # each worker keeps the users it served for local_ttl seconds and shares them with the other workers for ttl
+    # seconds through the shared cache, so an invalidation reaches every worker within local_ttl
+    def __init__(self, ttl: float = None, local_ttl: float = None, max_entries: int = None,
+                 cache: CacheBackend = None):
+        self.ttl = ttl if ttl is not None else float(os.environ.get('MULTICAM_USER_CACHE_TTL', 300))
+        self.local_ttl = local_ttl if local_ttl is not None else float(
+            os.environ.get('MULTICAM_USER_CACHE_LOCAL_TTL', 5))
+        self.max_entries = max_entries or int(os.environ.get('MULTICAM_USER_CACHE_SIZE', 10000))
+        self._cache = cache
+        self._users: OrderedDict[str, tuple[float, User]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self) -> CacheBackend:
+        return self._cache or get_cache()
+
+    def _remember(self, user_id: str, user: User):
+        with self._lock:
+            self._users[user_id] = (time.monotonic() + self.local_ttl, user)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_entries:
+                self._users.popitem(last=False)
+
+    def get(self, user_id, loader: Callable[[], Optional[User]]) -> Optional[User]:
+        # cached users are detached copies that are only read, loader runs the query when no worker has the user
+        user_id = str(user_id)
+        with self._lock:
+            expires_at, user = self._users.get(user_id, (0.0, None))
+        if expires_at > time.monotonic():
+            return user
+        fields = self.cache.get_many(user_cache_namespace, [user_id]).get(user_id)
+        if fields is not None:
+            user = User(**fields)
+        else:
+            user = loader()
+            if user is None:
+                return None
+            self.cache.put_many(user_cache_namespace, {user_id: user_fields(user)}, self.ttl)
+            user = User(**user_fields(user))
+        self._remember(user_id, user)
+        return user
+
+    def invalidate(self, user_id):
+        user_id = str(user_id)
+        with self._lock:
+            self._users.pop(user_id, None)
+        self.cache.delete(user_cache_namespace, user_id)
+
+
+user_cache = UserCache()
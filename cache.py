@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+default_cache_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'cache.db')
+
+
+class CacheBackend(ABC):
+    # json values with a ttl, grouped by namespace, shared by every worker; a lost entry only costs a reload
+    @abstractmethod
+    def get_many(self, namespace: str, keys) -> dict[str, dict]:
+        # entries that exist and have not expired, missing keys are left out
+        ...
+
+    @abstractmethod
+    def put_many(self, namespace: str, entries: dict[str, dict], ttl: float):
+        ...
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str):
+        ...
+
+
+class LocalCacheBackend(CacheBackend):
+    # process-local stand-in, only shared between threads of one worker
+    def __init__(self):
+        self._entries: dict[tuple[str, str], tuple[float, dict]] = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, namespace: str, keys) -> dict[str, dict]:
+        now = time.time()
+        entries = {}
+        with self._lock:
+            for key in keys:
+                expires_at, value = self._entries.get((namespace, str(key)), (0.0, None))
+                if expires_at > now:
+                    entries[str(key)] = dict(value)
+        return entries
+
+    def put_many(self, namespace: str, entries: dict[str, dict], ttl: float):
+        now = time.time()
+        with self._lock:
+            for key in [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]:
+                del self._entries[key]
+            for key, value in entries.items():
+                self._entries[(namespace, str(key))] = (now + ttl, dict(value))
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._entries.pop((namespace, str(key)), None)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    # a database file of its own, so cache writes never wait on the stream registry's write lock
+    def __init__(self, path: str = default_cache_path, timeout: float = 5.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS cache (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (namespace, key)
+            );
+            CREATE INDEX IF NOT EXISTS ix_cache_expires_at ON cache (expires_at);
+        ''')
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # one connection per thread, reopened after a fork so workers never share a file handle
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get_many(self, namespace: str, keys) -> dict[str, dict]:
+        keys = [str(key) for key in keys]
+        entries = {}
+        # chunked to stay under sqlite's bound parameter limit
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self.conn.execute(f'SELECT key, data FROM cache WHERE namespace = ? AND expires_at > ? '
+                                     f'AND key IN ({", ".join("?" * len(chunk))})',
+                                     (namespace, time.time(), *chunk))
+            entries.update((key, json.loads(data)) for key, data in rows)
+        return entries
+
+    def put_many(self, namespace: str, entries: dict[str, dict], ttl: float):
+        now = time.time()
+        conn = self.conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM cache WHERE expires_at <= ?', (now,))
+            conn.executemany('INSERT OR REPLACE INTO cache (namespace, key, expires_at, data) VALUES (?, ?, ?, ?)',
+                             [(namespace, str(key), now + ttl, json.dumps(value)) for key, value in entries.items()])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def delete(self, namespace: str, key: str):
+        self.conn.execute('DELETE FROM cache WHERE namespace = ? AND key = ?', (namespace, str(key)))
+
+
+_cache: Optional[CacheBackend] = None
+_cache_lock = threading.Lock()
+
+
+def create_cache(backend: str = None, path: str = None) -> CacheBackend:
+    backend = backend or os.environ.get('MULTICAM_CACHE_BACKEND', 'sqlite')
+    if backend == 'sqlite':
+        return SQLiteCacheBackend(path or os.environ.get('MULTICAM_CACHE_PATH', default_cache_path))
+    if backend == 'local':
+        return LocalCacheBackend()
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+
+def get_cache() -> CacheBackend:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = create_cache()
+                logger.info(f"Using {type(_cache).__name__} for the shared cache")
+    return _cache
+
+
+def set_cache(cache: CacheBackend):
+    global _cache
+    _cache = cache
@@ -0,0 +1,4 @@
+def post_worker_init(worker):
+    # each worker starts its own background threads once the app is loaded, after the fork
+    from app import app, start_background_jobs
+    start_background_jobs(app)
@@ -0,0 +1,134 @@
+import http.client
+import logging
+import os
+import threading
+import time
+from collections import deque
+from http.client import HTTPMessage
+from typing import Optional
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# errors raised when the server closed a kept-alive socket before our request reached it
+stale_connection_errors = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError,
+                           http.client.CannotSendRequest)
+idempotent_methods = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+
+class PoolTimeout(Exception):
+    ...
+
+
+class PooledResponse:
+    __slots__ = ('status', 'reason', 'headers', 'body')
+
+    def __init__(self, status: int, reason: str, headers: HTTPMessage, body: bytes):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    def text(self) -> str:
+        return self.body.decode('utf-8')
+
+
+class HTTPSConnectionPool:
+    # keep-alive connections to one host, shared by every thread of the worker
+    # every wait is bounded, so a slow upstream costs a request its timeouts and never pins the thread for good
+    def __init__(self, host: str, max_size: int = 10, idle_timeout: float = 60.0, connect_timeout: float = 3.05,
+                 read_timeout: float = 10.0, acquire_timeout: Optional[float] = None):
+        self.host = host
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.acquire_timeout = acquire_timeout if acquire_timeout is not None else connect_timeout + read_timeout
+        self._idle: deque[tuple[http.client.HTTPSConnection, float]] = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def _new_connection(self) -> http.client.HTTPSConnection:
+        conn = http.client.HTTPSConnection(self.host, timeout=self.connect_timeout)
+        conn.connect()
+        # the connect timeout only covers the tcp and tls handshake, every read after it gets its own budget
+        conn.sock.settimeout(self.read_timeout)
+        return conn
+
+    def _checkout(self) -> tuple[http.client.HTTPSConnection, bool]:
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                # most recently used first, those are the least likely to have been closed by the server
+                conn, last_used = self._idle.pop()
+                if now - last_used <= self.idle_timeout:
+                    return conn, True
+                conn.close()
+        return self._new_connection(), False
+
+    def _checkin(self, conn: http.client.HTTPSConnection):
+        now = time.monotonic()
+        with self._lock:
+            self._idle.append((conn, now))
+            # oldest first, a pool that goes quiet does not keep sockets the server has long since closed
+            while self._idle and now - self._idle[0][1] > self.idle_timeout:
+                self._idle.popleft()[0].close()
+
+    def request(self, method: str, url: str, body=None, headers: dict = None) -> PooledResponse:
+        # a dropped kept-alive connection is only retried for idempotent methods, the server may already have acted
+        # on a POST it never answered, so those surface the error and the caller decides
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise PoolTimeout(f"All {self.max_size} connections to {self.host} are busy")
+        try:
+            conn, reused = self._checkout()
+            try:
+                return self._send(conn, method, url, body, headers)
+            except stale_connection_errors:
+                if not reused or method not in idempotent_methods:
+                    raise
+                logger.info(f"Reconnecting to {self.host} after the server dropped a kept-alive connection")
+            return self._send(self._new_connection(), method, url, body, headers)
+        finally:
+            self._slots.release()
+
+    def _send(self, conn: http.client.HTTPSConnection, method, url, body, headers) -> PooledResponse:
+        try:
+            conn.request(method, url, body=body, headers=headers or {})
+            res = conn.getresponse()
+            data = res.read()
+        except BaseException:
+            # a connection that failed mid request is closed here and never goes back to the pool
+            conn.close()
+            raise
+        if res.will_close:
+            conn.close()
+        else:
+            self._checkin(conn)
+        return PooledResponse(res.status, res.reason, res.headers, data)
+
+    def close(self):
+        with self._lock:
+            while self._idle:
+                self._idle.pop()[0].close()
+
+
+_pools: dict[str, HTTPSConnectionPool] = {}
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+
+
+def get_pool(host: str) -> HTTPSConnectionPool:
+    global _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            # sockets inherited from the gunicorn master must not be shared with it
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(host)
+        if pool is None:
+            pool = HTTPSConnectionPool(host, max_size=int(os.environ.get('MULTICAM_HTTP_POOL_SIZE', 10)),
+                                       idle_timeout=float(os.environ.get('MULTICAM_HTTP_POOL_IDLE_TIMEOUT', 60)),
+                                       connect_timeout=float(os.environ.get('MULTICAM_HTTP_CONNECT_TIMEOUT', 3.05)),
+                                       read_timeout=float(os.environ.get('MULTICAM_HTTP_READ_TIMEOUT', 10)))
+            _pools[host] = pool
+        return pool
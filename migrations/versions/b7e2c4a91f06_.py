@@ -0,0 +1,59 @@
+"""key streams by user and object id
+
+Revision ID: b7e2c4a91f06
+Revises: 5974d13d3e5b
+Create Date: 2026-10-18 21:04:12.318552
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2c4a91f06'
+down_revision = '5974d13d3e5b'
+branch_labels = None
+depends_on = None
+
+columns = ('object_id', 'cam_angle', 'cam_label', 'stream_name', 'stream_id', 'password', 'user_name', 'embed_code',
+           'hls', 'primary_server', 'encoding_profile', 'broadcast_location', 'user_id', 'active')
+
+
+def _rebuild(*constraints):
+    # sqlite cannot change a primary key in place, the table is copied into one with the new key
+    op.create_table('_stream_new',
+    sa.Column('object_id', sa.String(), nullable=False),
+    sa.Column('cam_angle', sa.String(), nullable=True),
+    sa.Column('cam_label', sa.String(), nullable=True),
+    sa.Column('stream_name', sa.String(), nullable=True),
+    sa.Column('stream_id', sa.String(), nullable=True),
+    sa.Column('password', sa.String(), nullable=True),
+    sa.Column('user_name', sa.String(), nullable=True),
+    sa.Column('embed_code', sa.String(), nullable=True),
+    sa.Column('hls', sa.String(), nullable=True),
+    sa.Column('primary_server', sa.String(), nullable=True),
+    sa.Column('encoding_profile', sa.String(), nullable=True),
+    sa.Column('broadcast_location', sa.String(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('active', sa.Boolean(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    *constraints
+    )
+    op.execute(f'INSERT INTO _stream_new ({", ".join(columns)}) SELECT {", ".join(columns)} FROM stream')
+    with op.batch_alter_table('stream', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_stream_user_id'))
+        batch_op.drop_index(batch_op.f('ix_stream_active'))
+    op.drop_table('stream')
+    op.rename_table('_stream_new', 'stream')
+    with op.batch_alter_table('stream', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_stream_active'), ['active'], unique=False)
+        batch_op.create_index(batch_op.f('ix_stream_user_id'), ['user_id'], unique=False)
+
+
+def upgrade():
+    # object ids are chosen by clients and only unique per user
+    _rebuild(sa.PrimaryKeyConstraint('user_id', 'object_id'))
+
+
+def downgrade():
+    _rebuild(sa.PrimaryKeyConstraint('object_id'), sa.UniqueConstraint('object_id'))
@@ -1,5 +1,8 @@
+import json
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from typing import List, Optional
+from sqlalchemy import ForeignKey, PrimaryKeyConstraint, String
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from flask_login import UserMixin
 
 
@@ -16,20 +19,41 @@ class User(db.Model, UserMixin):
     email: Mapped[str] = mapped_column()
     token_data: Mapped[str] = mapped_column()
     profile_image_url: Mapped[str] = mapped_column()
-    # streams: Mapped[List['Stream']] = relationship('Stream', back_populates='user')
+    streams: Mapped[List['Stream']] = relationship('Stream', back_populates='user')
+
+    @property
+    def access_token(self) -> Optional[str]:
+        # the twitch token the user logged in with, token_data holds the whole oauth token response
+        # users served from auth.usercache carry no token_data, it is read from the database only when it is needed
+        token_data = self.token_data
+        if token_data is None and self.id is not None:
+            token_data = db.session.execute(db.select(User.token_data).where(User.id == self.id)).scalar()
+        try:
+            return json.loads(token_data or '{}').get('access_token')
+        except (TypeError, ValueError):
+            return None
 
 
 # TODO : rewrite this User class to implement user mixin methods
 
-# class Stream(db.Model):
-#     object_id: Mapped[str] = mapped_column(String, primary_key=True, unique=True)
-#     cam_angle: Mapped[str] = mapped_column()
-#     cam_label: Mapped[str] = mapped_column()
-#     stream_name: Mapped[str] = mapped_column()
-#     stream_id: Mapped[str] = mapped_column()
-#     password: Mapped[str] = mapped_column()
-#     user_name: Mapped[str] = mapped_column()
-#     embed_code: Mapped[str] = mapped_column()
-#     user_id: Mapped[int] = mapped_column(ForeignKey('user.id'))
-#     active: Mapped[bool] = mapped_column(default=False)
-#     user: Mapped[User] = relationship('User', back_populates='streams')
+class Stream(db.Model):
+    # durable copy of the stream registry, written behind by wowza.persistence and reloaded on startup
+    # keyed like the registry, object ids are chosen by clients and only unique per user
+    __table_args__ = (PrimaryKeyConstraint('user_id', 'object_id'),)
+    object_id: Mapped[str] = mapped_column(String)
+    cam_angle: Mapped[Optional[str]] = mapped_column()
+    cam_label: Mapped[Optional[str]] = mapped_column()
+    stream_name: Mapped[Optional[str]] = mapped_column()
+    stream_id: Mapped[Optional[str]] = mapped_column()
+    password: Mapped[Optional[str]] = mapped_column()
+    user_name: Mapped[Optional[str]] = mapped_column()
+    embed_code: Mapped[Optional[str]] = mapped_column()
+    hls: Mapped[Optional[str]] = mapped_column()
+    primary_server: Mapped[Optional[str]] = mapped_column()
+    encoding_profile: Mapped[Optional[str]] = mapped_column()
+    broadcast_location: Mapped[Optional[str]] = mapped_column()
+    registered_at: Mapped[Optional[float]] = mapped_column()
+    last_active_at: Mapped[Optional[float]] = mapped_column()
+    user_id: Mapped[int] = mapped_column(ForeignKey('user.id'), index=True)
+    active: Mapped[bool] = mapped_column(default=False, index=True)
+    user: Mapped[User] = relationship('User', back_populates='streams')
@@ -0,0 +1,99 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+from oauth.helix import helix_concurrency
+from oauth.twitchclass import TwitchUserService
+from wowza.background import LazyExecutor
+from wowza.singleflight import SingleFlight
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# field of each list entry holding the id of the other side of the follow
+id_fields = {'followed': 'broadcaster_id', 'followers': 'user_id'}
+
+
+class _Entry:
+    __slots__ = ('fetched_at', 'value', 'ids')
+
+    def __init__(self, kind: str, value: dict):
+        self.fetched_at = time.monotonic()
+        self.value = value
+        # built once per fetch so membership tests against the list are O(1)
+        field = id_fields[kind]
+        self.ids = frozenset(str(item[field]) for item in value.get('data', []) if field in item)
+
+
+class FollowCache:
+    # per user copies of the twitch follow lists, kept in this worker
+    # a list younger than ttl is served as is, one up to ttl + stale_ttl old is served while a background refresh
+    # replaces it, anything older is fetched in the request; the least recently used lists go first when full
+    def __init__(self, ttl: float = None, stale_ttl: float = None, max_entries: int = None):
+        self.ttl = ttl if ttl is not None else float(os.environ.get('MULTICAM_FOLLOW_CACHE_TTL', 300))
+        self.stale_ttl = stale_ttl if stale_ttl is not None else float(
+            os.environ.get('MULTICAM_FOLLOW_CACHE_STALE_TTL', 3600))
+        self.max_entries = max_entries or int(os.environ.get('MULTICAM_FOLLOW_CACHE_SIZE', 10000))
+        self._entries: OrderedDict[tuple[str, str], _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+        self.executor = LazyExecutor(helix_concurrency, 'follow-refresh')
+
+    def _store(self, key: tuple[str, str], entry: _Entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _load(self, key: tuple[str, str], loader: Callable[[], dict]) -> _Entry:
+        entry = _Entry(key[0], loader())
+        self._store(key, entry)
+        return entry
+
+    def _refresh(self, key: tuple[str, str], loader: Callable[[], dict]):
+        try:
+            self._flights.do(key, self._load, key, loader)
+        except Exception as e:
+            # the stale list keeps being served until it expires or a refresh succeeds
+            logger.warning(f"Could not refresh {key[0]} of user {key[1]}: {str(e)}")
+
+    def get(self, kind: str, user_id, loader: Callable[[], dict]) -> _Entry:
+        key = (kind, str(user_id))
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+        if cached is not None:
+            age = time.monotonic() - cached.fetched_at
+            if age < self.ttl:
+                return cached
+            if age < self.ttl + self.stale_ttl:
+                if not self._flights.in_flight(key):
+                    self.executor.submit(self._refresh, key, loader)
+                return cached
+        return self._flights.do(key, self._load, key, loader)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == str(user_id)]:
+                del self._entries[key]
+
+    def _followed(self, user_id, access_token: str) -> _Entry:
+        return self.get('followed', user_id, lambda: TwitchUserService(access_token).get_followed(str(user_id)))
+
+    def get_followed(self, user_id, access_token: str) -> dict:
+        return self._followed(user_id, access_token).value
+
+    def followed_ids(self, user_id, access_token: str) -> frozenset[str]:
+        return self._followed(user_id, access_token).ids
+
+    def get_followers(self, user_id, access_token: str) -> dict:
+        return self.get('followers', user_id,
+                        lambda: TwitchUserService(access_token).get_followers(str(user_id))).value
+
+
+follow_cache = FollowCache()
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from http.client import HTTPException
+from time import sleep
+from typing import Iterator, Optional
+from urllib.parse import urlencode
+
+from httppool import PoolTimeout, get_pool
+from resilience import TokenBucket, backoff_delays, retry_after
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+helix_host = 'api.twitch.tv'
+# twitch gives every client id and user token pair a bucket of 800 points that refills over a minute
+helix_bucket_size = float(os.environ.get('MULTICAM_HELIX_BUCKET_SIZE', 800))
+helix_max_wait = float(os.environ.get('MULTICAM_HELIX_MAX_WAIT', 5))
+helix_max_attempts = int(os.environ.get('MULTICAM_HELIX_MAX_ATTEMPTS', 3))
+helix_page_size = 100
+# pages of a follow list fetched in one request, longer lists are cut there and keep the cursor of the next page
+helix_max_pages = int(os.environ.get('MULTICAM_HELIX_MAX_PAGES', 10))
+# /helix/users takes at most 100 id parameters per call, larger lookups are split and fetched side by side
+helix_users_batch_size = 100
+helix_concurrency = int(os.environ.get('MULTICAM_HELIX_CONCURRENCY', 4))
+# twitch profiles shared by every worker through the shared cache
+twitch_user_cache = 'twitch-users'
+twitch_user_ttl = float(os.environ.get('MULTICAM_TWITCH_USER_TTL', 3600))
+
+
+class HelixAPIException(HTTPException):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def _header_float(headers, name) -> Optional[float]:
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+class HelixClient:
+    # one keep-alive connection pool to api.twitch.tv per worker, shared by every TwitchUserService
+    # calls are paced by a token bucket per access token, kept in step with twitch's Ratelimit-* headers
+    def __init__(self, client_id: str = None, max_buckets: int = 1024):
+        self._client_id = client_id
+        self.max_buckets = max_buckets
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, access_token: str) -> TokenBucket:
+        key = hashlib.sha256(access_token.encode()).hexdigest()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(helix_bucket_size, helix_bucket_size / 60)
+                if len(self._buckets) > self.max_buckets:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket
+
+    @property
+    def client_id(self) -> Optional[str]:
+        # read late, the .env file is loaded by whoever imports this module
+        return self._client_id or os.environ.get('TWITCH_CLIENT_ID')
+
+    def get(self, access_token: str, endpoint: str, params=None) -> dict:
+        # every helix call used here is a GET, so transport errors, 429s and 5xx are all retried
+        url = f'/helix/{endpoint}' + (f'?{urlencode(params, doseq=True)}' if params else '')
+        headers = {'Authorization': f'Bearer {access_token}', 'Client-Id': self.client_id}
+        bucket = self._bucket(access_token)
+        delays = backoff_delays()
+        for attempt in range(1, helix_max_attempts + 1):
+            if not bucket.acquire(helix_max_wait):
+                raise HelixAPIException(f"Twitch rate limit exhausted for GET {url}", status=429)
+            last_attempt = attempt == helix_max_attempts
+            try:
+                res = get_pool(helix_host).request('GET', url, headers=headers)
+            except (OSError, HTTPException, PoolTimeout) as e:
+                if last_attempt:
+                    raise HelixAPIException(f"GET {url} failed: {str(e)}") from e
+                sleep(next(delays))
+                continue
+            bucket.sync(_header_float(res.headers, 'Ratelimit-Limit'),
+                        _header_float(res.headers, 'Ratelimit-Remaining'), retry_after(res.headers))
+            if res.status == 429 or res.status >= 500:
+                delay = max(next(delays), retry_after(res.headers) or 0)
+                if last_attempt or delay > helix_max_wait:
+                    raise HelixAPIException(f"GET {url} returned {res.status}", status=res.status)
+                logger.warning(f"GET {url} returned {res.status}, retrying in {delay:.1f}s")
+                sleep(delay)
+                continue
+            if res.status >= 400:
+                raise HelixAPIException(f"GET {url} returned {res.status}: {res.text()[:200]}", status=res.status)
+            return json.loads(res.body)
+
+    def pages(self, access_token: str, endpoint: str, params: dict) -> Iterator[dict]:
+        # yields each page as twitch returns it and fetches the next one only when the caller asks for it
+        params = {**params, 'first': helix_page_size}
+        while True:
+            page = self.get(access_token, endpoint, params)
+            yield page
+            cursor = (page.get('pagination') or {}).get('cursor')
+            if not cursor or not page.get('data'):
+                return
+            params['after'] = cursor
+
+
+helix_client = HelixClient()
@@ -1,6 +1,8 @@
 import logging
 from flask import Blueprint, request, session, jsonify
-from oauth.twitchclass import OauthFacade, extract_twitch_info, TwitchUserService
+from oauth.twitchclass import OauthFacade, extract_twitch_info
+from oauth.follows import follow_cache
+from oauth.helix import HelixAPIException
 from flask_login import current_user, login_required
 from auth.auth import _login_user
 
@@ -153,8 +155,11 @@ def get_followed():
         """
     user_id = current_user.id
     access_token = current_user.access_token
-    twitch_user = TwitchUserService(access_token=access_token)
-    following_data = twitch_user.get_followed(user_id)
+    try:
+        following_data = follow_cache.get_followed(user_id, access_token)
+    except HelixAPIException as e:
+        logger.error(f"Could not fetch followed channels of user {user_id}: {str(e)}")
+        return jsonify({'error': 'Failed to retrieve followed users.'}), 500
     return following_data
 
 
@@ -211,8 +216,11 @@ def get_followers():
       """
     user_id = current_user.id
     access_token = current_user.access_token
-    twitch_user = TwitchUserService(access_token=access_token)
-    followers_data = twitch_user.get_followers(user_id)
+    try:
+        followers_data = follow_cache.get_followers(user_id, access_token)
+    except HelixAPIException as e:
+        logger.error(f"Could not fetch followers of user {user_id}: {str(e)}")
+        return jsonify({'error': 'Failed to retrieve followers.'}), 500
     return followers_data
 # TODO : change the database schema or find a way to access the access token
 # TODO: write an endpoint for token validation.
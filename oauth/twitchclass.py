@@ -3,10 +3,15 @@ import http.client
 from http.client import HTTPException
 from urllib.parse import quote, urlencode
 from uuid import uuid4, UUID
-from typing import Union, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Union, Dict, Any, Iterable, Iterator
 import os
 from dotenv import load_dotenv
 import json
+from oauth.helix import helix_client, helix_concurrency, helix_max_pages, helix_users_batch_size, twitch_user_cache, \
+    twitch_user_ttl
+from cache import get_cache
 
 load_dotenv()
 
@@ -274,7 +279,7 @@ class TwitchUserBase(ABC):
         ...
 
     @abstractmethod
-    def get_multiple_user_details(self):
+    def get_multiple_user_details(self, user_ids: Iterable[str]):
         ...
 
     @abstractmethod
@@ -286,40 +291,66 @@ class TwitchUserBase(ABC):
         ...
 
 
+def _collect(pages: Iterator[dict], max_pages: int = None) -> dict:
+    # the first max_pages pages of a paginated helix list joined into one response of the same shape
+    # a list cut short keeps the cursor of its next page, total still counts every entry
+    data = []
+    total = None
+    cursor = None
+    for page in islice(pages, max_pages or helix_max_pages):
+        data.extend(page.get('data', []))
+        total = page.get('total', total)
+        cursor = (page.get('pagination') or {}).get('cursor') if page.get('data') else None
+    return {'data': data, 'total': total if total is not None else len(data),
+            'pagination': {'cursor': cursor} if cursor else {}}
+
+
 class TwitchUserService(TwitchUserBase):
     base_url = 'api.twitch.tv'
 
     def __init__(self, access_token: str):
+        # building a service opens no socket, requests go through the worker's shared helix client
         self.access_token = access_token
-        self.conn = http.client.HTTPSConnection(TwitchUserService.base_url)
-        self.headers = {'Authorization': f'Bearer {self.access_token}', 'Client-Id': os.environ.get('TWITCH_CLIENT_ID')}
+        self.client = helix_client
 
     def get_user_details(self):
-        endpoint = '/helix/users'
-        self.conn.request('GET', endpoint, headers=self.headers)
-        response = self.conn.getresponse()
-        data = response.read()
-        user_details = json.loads(data.decode('utf-8'))
-        return user_details
-
-    def get_multiple_user_details(self):
-        ...
+        return self.client.get(self.access_token, 'users')
+
+    def _get_users(self, user_ids: list[str]) -> list[dict]:
+        return self.client.get(self.access_token, 'users', {'id': user_ids}).get('data', [])
+
+    def get_multiple_user_details(self, user_ids: Iterable[str]):
+        # cached profiles first, the rest in batches of 100 ids fetched concurrently and written back to the cache
+        user_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+        cache = get_cache()
+        users = cache.get_many(twitch_user_cache, user_ids)
+        missing = [user_id for user_id in user_ids if user_id not in users]
+        if missing:
+            batches = [missing[start:start + helix_users_batch_size]
+                       for start in range(0, len(missing), helix_users_batch_size)]
+            if len(batches) == 1:
+                fetched = [self._get_users(batches[0])]
+            else:
+                with ThreadPoolExecutor(max_workers=min(len(batches), helix_concurrency),
+                                        thread_name_prefix='helix-users') as executor:
+                    fetched = list(executor.map(self._get_users, batches))
+            found = {user['id']: user for batch in fetched for user in batch}
+            if found:
+                cache.put_many(twitch_user_cache, found, twitch_user_ttl)
+            users.update(found)
+        return {'data': [users[user_id] for user_id in user_ids if user_id in users]}
+
+    def iter_followers(self, user_id: str) -> Iterator[dict]:
+        return self.client.pages(self.access_token, 'channels/followers', {'broadcaster_id': user_id})
+
+    def iter_followed(self, user_id: str) -> Iterator[dict]:
+        return self.client.pages(self.access_token, 'channels/followed', {'user_id': user_id})
 
     def get_followers(self, user_id: str):
-        endpoint = f'/helix/channels/followers?user_id={user_id}'
-        self.conn.request('GET', endpoint, headers=self.headers)
-        response = self.conn.getresponse()
-        data = response.read()
-        followers = json.loads(data.decode('utf-8'))
-        return followers
+        return _collect(self.iter_followers(user_id))
 
     def get_followed(self, user_id: str):
-        endpoint = f'/helix/channels/followed?user_id={user_id}'
-        self.conn.request('GET', endpoint, headers=self.headers)
-        response = self.conn.getresponse()
-        data = response.read()
-        followed = json.loads(data.decode('utf-8'))
-        return followed
+        return _collect(self.iter_followed(user_id))
 
 
 def extract_twitch_info(data: Dict[str, Any], key: str) -> Union[str, None]:
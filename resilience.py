@@ -0,0 +1,150 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Iterator, Optional
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    ...
+
+
+def backoff_delays(base: float = 0.5, factor: float = 2.0, maximum: float = 30.0) -> Iterator[float]:
+    # exponential delays with jitter in the upper half, so clients retrying together spread out
+    attempt = 0
+    while True:
+        bound = min(maximum, base * factor ** attempt)
+        yield bound / 2 + random.uniform(0, bound / 2)
+        attempt += 1
+
+
+def retry_after(headers) -> Optional[float]:
+    # seconds the server asked us to wait, from Retry-After or a rate-limit reset header
+    if headers is None:
+        return None
+    value = headers.get('Retry-After')
+    if value is not None:
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                return None
+    for name in ('RateLimit-Reset', 'X-RateLimit-Reset'):
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            reset = float(value)
+        except ValueError:
+            return None
+        # some apis send a unix timestamp, others the seconds left in the window
+        return max(reset - time.time(), 0.0) if reset > 1e9 else max(reset, 0.0)
+    return None
+
+
+class CircuitBreaker:
+    # opens after failure_threshold consecutive failures and fails fast for reset_timeout seconds, then lets a
+    # single trial call through: its success closes the circuit, its failure opens it again
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def before_call(self) -> bool:
+        # True when this call is the trial, the caller must then end it with record_success, record_failure or
+        # record_skipped whatever happens, or the circuit stays half open and rejects every call
+        with self._lock:
+            state = self._state()
+            if state == 'open' or (state == 'half_open' and self._trial_running):
+                raise CircuitOpenError(f"{self.name} is unavailable, failing fast")
+            if state == 'half_open':
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info(f"Circuit of {self.name} closed")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_skipped(self):
+        # the call never reached the service, e.g. no local connection was free, so it says nothing about its health
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._trial_running:
+                    logger.warning(f"Circuit of {self.name} opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class TokenBucket:
+    # local mirror of a server-side rate limit bucket: spends a token per call, refills continuously and is
+    # resynced from the limit/remaining/reset headers of every response
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.refill_per_second)
+        self._updated_at = now
+
+    def acquire(self, timeout: float) -> bool:
+        # False when no token frees up within timeout, the caller should fail instead of queueing forever
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._blocked_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = max(self._blocked_until - now, (1 - self._tokens) / self.refill_per_second)
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def sync(self, limit: Optional[float], remaining: Optional[float], reset_in: Optional[float]):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if limit:
+                self.capacity = limit
+            if remaining is not None:
+                self._tokens = min(self._tokens, remaining)
+                if remaining < 1 and reset_in is not None:
+                    # the server bucket is empty until its reset, whatever our refill estimate says
+                    self._blocked_until = max(self._blocked_until, now + reset_in)
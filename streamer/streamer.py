@@ -1,7 +1,9 @@
 from flask import Blueprint, render_template, jsonify,request
-from flask_login import login_required
+from flask_login import login_required, current_user
 from streamer.utils import camera_angles
-from wowza.wowzaclient import WowzaFacade
+from wowza.profiles import default_encoding_profile, encoding_profiles
+from wowza.regions import region_selector
+from wowza.registry import stream_query
 
 streamer = Blueprint("streamer", __name__, template_folder="templates/streamer", static_folder="static")
 
@@ -36,7 +38,8 @@ def home():
                       example: "Unauthorized"
         """
 
-    return render_template('index.html',  camera_angles=camera_angles )
+    return render_template('index.html',  camera_angles=camera_angles, encoding_profiles=encoding_profiles,
+                           default_encoding_profile=default_encoding_profile, region_probes=region_selector.probes)
 
 
 @streamer.get('/api/v1/get_streamers')
@@ -74,8 +77,7 @@ def get_streamers():
                      example: "Unauthorized"
        """
 
-    wowza_service:WowzaFacade = WowzaFacade('default','default')
-    data:set = wowza_service.get_unique_user_ids()
+    data:set = stream_query.user_ids()
     data:list = list(data)
     return jsonify({'data':data}),200
 
@@ -137,7 +139,9 @@ def get_user_streams():
 
     data = request.get_json()
     streamer_id:str = data.get('streamer_id')
-    wowza_service:WowzaFacade = WowzaFacade('default','default')
-    instances:list[WowzaFacade] = wowza_service.get_user_instances(user_id=streamer_id)
-    serialized_instances:list[[dict]] = [instance.to_dict() for instance in instances]
+    # only the streamer gets the ingest credentials of their cameras
+    if str(streamer_id) == str(current_user.id):
+        serialized_instances:list[dict] = stream_query.user_streams(streamer_id)
+    else:
+        serialized_instances:list[dict] = stream_query.viewer_streams(streamer_id)
     return jsonify({'data':serialized_instances}),200
\ No newline at end of file
@@ -1,7 +1,28 @@
-from flask import Blueprint, render_template, request
-from flask_login import login_required
-from wowza.wowzaclient import WowzaFacade
+import json
+import logging
+import os
+import threading
+import time
+from flask import Blueprint, render_template, request, Response, stream_with_context, jsonify
+from flask_login import current_user, login_required
+from wowza.demand import viewer_demand
+from wowza.liveindex import live_streamers
+from wowza.registry import stream_query
 from models import User,db
+from oauth.follows import follow_cache
+from oauth.helix import HelixAPIException
+from oauth.twitchclass import TwitchUserService
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# every open event stream holds a server thread for up to event_stream_lifetime seconds, so a worker only serves a few
+# of them at once and keeps the rest of its threads for ordinary requests; a refused watch page polls
+# /api/v1/watch/updates every event_poll_interval seconds instead and tries the stream again later
+max_event_streams = int(os.environ.get('MULTICAM_MAX_EVENT_STREAMS', 8))
+event_stream_lifetime = float(os.environ.get('MULTICAM_EVENT_STREAM_LIFETIME', 300))
+event_poll_interval = float(os.environ.get('MULTICAM_EVENT_POLL_INTERVAL', 5))
+event_stream_slots = threading.BoundedSemaphore(max_event_streams)
 
 viewer = Blueprint('viewer', __name__, template_folder='templates/viewer', static_folder='static')
 
@@ -13,6 +34,15 @@ def index():
         Get a list of active streamers (users) who are currently broadcasting.
         ---
         description: This endpoint retrieves a list of users with active streams and returns them with associated button captions. The user must be logged in to access this endpoint.
+        parameters:
+          - name: tab
+            in: query
+            description: Which streamers to list, `live` for everyone on air, `following` for the live channels the viewer follows on Twitch and `registered` for every streamer with a camera.
+            required: false
+            schema:
+              type: string
+              enum: [live, following, registered]
+              default: live
         responses:
           200:
             description: A list of active streamers, rendered on the viewer page with associated button captions.
@@ -36,12 +66,34 @@ def index():
         """
 
     button_captions = ['live', 'following', 'registered']
-    wowza_service:WowzaFacade = WowzaFacade('default','default')
-    active_users:set = wowza_service.get_users_with_active_streams()
-    active_users_list:list = list(active_users)
+    tab = request.args.get('tab', 'live')
+    if tab not in button_captions:
+        tab = 'live'
+    live_ids = live_streamers.live_ids()
+    if tab == 'following':
+        try:
+            active_users = live_streamers.live_among(follow_cache.followed_ids(current_user.id,
+                                                                              current_user.access_token))
+        except HelixAPIException as e:
+            logger.warning(f"Could not load the channels user {current_user.id} follows: {str(e)}")
+            active_users = frozenset()
+    elif tab == 'registered':
+        active_users = {str(user_id) for user_id in stream_query.user_ids()}
+    else:
+        active_users = live_ids
+    active_users_list:list = [int(user_id) for user_id in active_users if user_id.isdigit()]
     streamer_obj_list:list[User] = db.session.query(User).filter(User.id.in_(active_users_list)).all()
-    print(active_users_list)
-    return render_template('viewer.html', button_captions=button_captions, active_users=streamer_obj_list)
+    # fresh display names and pictures in one cached, batched helix lookup, the login-time copy is the fallback
+    profiles = {}
+    if streamer_obj_list:
+        try:
+            twitch_user = TwitchUserService(access_token=current_user.access_token)
+            user_details = twitch_user.get_multiple_user_details(user.id for user in streamer_obj_list)
+            profiles = {user['id']: user for user in user_details['data']}
+        except HelixAPIException as e:
+            logger.warning(f"Could not refresh streamer profiles from twitch: {str(e)}")
+    return render_template('viewer.html', button_captions=button_captions, active_users=streamer_obj_list,
+                           profiles=profiles, tab=tab, live_ids=live_ids)
 
 
 @viewer.route('/api/v1/watch', methods=['GET', 'POST'])
@@ -92,7 +144,204 @@ def watch():
        """
 
     streamer_id = int(request.args.get('userId'))
-    wowza_service = WowzaFacade('default','default')
-    instances:list[WowzaFacade] = wowza_service.get_user_instances(user_id=streamer_id)
-    serialized_instances:list[[dict]] = [instance.to_dict() for instance in instances]
-    return render_template('watch.html',user_streams_data = serialized_instances)
+    # read before the streams, so the event stream replays anything that changes while the page loads
+    last_event_id = stream_query.last_event_id()
+    serialized_instances:list[dict] = stream_query.viewer_streams(streamer_id)
+    return render_template('watch.html',user_streams_data = serialized_instances, streamer_id=streamer_id,
+                           last_event_id=last_event_id, event_poll_interval=event_poll_interval)
+
+
+@viewer.get('/api/v1/watch/events')
+@login_required
+def watch_events():
+    """
+       Server-sent events for the camera angles of a streamer.
+       ---
+       description: This endpoint keeps a `text/event-stream` open and pushes `camera_added`, `camera_started`, `camera_stopped` and `camera_removed` events for the streamer's cameras as they happen. The connection is closed after a few minutes, browsers reconnect on their own and resume from the `Last-Event-ID` header. When the worker already serves `MULTICAM_MAX_EVENT_STREAMS` streams the request is refused with 503, the watch page then polls `/api/v1/watch/updates` instead.
+       parameters:
+         - name: userId
+           in: query
+           description: The ID of the streamer whose camera events the viewer wants.
+           required: true
+           schema:
+             type: integer
+             example: 123
+       responses:
+         200:
+           description: An event stream, each event carries the stream record as JSON data.
+           content:
+             text/event-stream:
+               schema:
+                 type: string
+                 example: "id: 42\nevent: camera_started\ndata: {\"object_id\": \"abc123\", \"stream_state\": true}\n\n"
+         401:
+           description: Unauthorized. The user must be logged in to follow the stream.
+           content:
+             application/json:
+               schema:
+                 type: object
+                 properties:
+                   error:
+                     type: string
+                     example: "Unauthorized"
+         503:
+           description: The worker serves as many event streams as it may, retry after the `Retry-After` header or poll for updates.
+       security:
+         - oauth2: []  # Assumes OAuth2 security for this route
+       """
+
+    streamer_id = int(request.args.get('userId'))
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    if last_event_id is None:
+        # a page reconnecting after a refused stream passes its position in the query string
+        last_event_id = request.args.get('lastEventId', type=int)
+    if last_event_id is None:
+        last_event_id = stream_query.last_event_id()
+    if not event_stream_slots.acquire(blocking=False):
+        return jsonify({'status': 'failed', 'error': 'Too many open event streams, retry later'}), 503, \
+            {'Retry-After': '15'}
+
+    def events(after_id: int):
+        # bounded so one browser tab never holds a worker thread forever
+        deadline = time.monotonic() + event_stream_lifetime
+        yield 'retry: 3000\n\n'
+        while time.monotonic() < deadline:
+            new_events = stream_query.wait_for_events(streamer_id, after_id, timeout=15)
+            if not new_events:
+                yield ': keep-alive\n\n'
+                continue
+            for event_id, event in new_events:
+                after_id = event_id
+                yield f"id: {event_id}\nevent: {event['type']}\ndata: {json.dumps(event['stream'])}\n\n"
+
+    response = Response(stream_with_context(events(last_event_id)), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # the server closes the response when the stream ends or the browser goes away, even before it started
+    response.call_on_close(event_stream_slots.release)
+    return response
+
+
+@viewer.get('/api/v1/watch/updates')
+@login_required
+def watch_updates():
+    """
+       Camera events of a streamer since a given event id, for pages that cannot keep an event stream open.
+       ---
+       description: Returns at once with the same events `/api/v1/watch/events` would have pushed after the `after` id, and the id to pass on the next call. The watch page polls this while its event stream is refused.
+       parameters:
+         - name: userId
+           in: query
+           description: The ID of the streamer whose camera events the viewer wants.
+           required: true
+           schema:
+             type: integer
+             example: 123
+         - name: after
+           in: query
+           description: The id of the last event the page has applied, defaults to the newest event.
+           required: false
+           schema:
+             type: integer
+             example: 41
+       responses:
+         200:
+           description: The events after `after`, oldest first.
+           content:
+             application/json:
+               schema:
+                 type: object
+                 properties:
+                   status:
+                     type: string
+                     example: "success"
+                   data:
+                     type: object
+                     example: {"last_event_id": 42, "events": [{"id": 42, "type": "camera_started", "stream": {"object_id": "abc123", "stream_state": true}}]}
+         401:
+           description: Unauthorized. The user must be logged in to follow the stream.
+       security:
+         - oauth2: []  # Assumes OAuth2 security for this route
+       """
+
+    streamer_id = int(request.args.get('userId'))
+    after_id = request.args.get('after', type=int)
+    if after_id is None:
+        return jsonify({'status': 'success', 'data': {'last_event_id': stream_query.last_event_id(), 'events': []}})
+    new_events = stream_query.events_since(streamer_id, after_id)
+    return jsonify({'status': 'success', 'data': {
+        'last_event_id': new_events[-1][0] if new_events else after_id,
+        'events': [{'id': event_id, 'type': event['type'], 'stream': event['stream']} for event_id, event in new_events],
+    }})
+
+
+@viewer.route('/api/v1/watch/presence', methods=['POST', 'DELETE'])
+@login_required
+def watch_presence():
+    """
+       Report which camera angle of a streamer the viewer is watching.
+       ---
+       description: The watch page calls this with `POST` when the viewer opens an angle and then every few seconds while it stays open, and with `DELETE` when the page is closed. A viewer who stops reporting is dropped after `MULTICAM_VIEWER_PRESENCE_TTL` seconds. With `MULTICAM_ON_DEMAND_STREAMS` enabled, the first viewer of a stopped non-default angle starts it, and angles nobody watches are stopped after a cool-down.
+       requestBody:
+         required: true
+         content:
+           application/json:
+             schema:
+               type: object
+               properties:
+                 userId:
+                   type: integer
+                   description: The ID of the streamer.
+                   example: 123
+                 objectId:
+                   type: string
+                   description: The object ID of the camera angle being watched.
+                   example: "abc123"
+                 viewerId:
+                   type: string
+                   description: Optional id of the browser tab, so one viewer can watch in several tabs.
+                   example: "3f0c2a8e-5b1d-4c55-9a0e-1d2f3a4b5c6d"
+       responses:
+         200:
+           description: Presence recorded.
+           content:
+             application/json:
+               schema:
+                 type: object
+                 properties:
+                   status:
+                     type: string
+                     example: "success"
+                   starting:
+                     type: boolean
+                     description: Whether the angle is being started for this viewer.
+                     example: true
+         400:
+           description: Missing required parameters (`userId` or `objectId`).
+           content:
+             application/json:
+               schema:
+                 type: object
+                 properties:
+                   status:
+                     type: string
+                     example: "failed"
+                   error:
+                     type: string
+                     example: "Missing required parameters: userId, objectId"
+         401:
+           description: Unauthorized. The user must be logged in.
+       security:
+         - oauth2: []  # Assumes OAuth2 security for this route
+       """
+
+    data = request.get_json(silent=True) or {}
+    streamer_id = data.get('userId')
+    object_id = data.get('objectId')
+    if streamer_id is None or not object_id:
+        return jsonify({'status': 'failed', 'error': 'Missing required parameters: userId, objectId'}), 400
+    viewer_id = f"{current_user.id}:{data.get('viewerId', '')}"
+    if request.method == 'DELETE':
+        viewer_demand.leave(viewer_id, streamer_id, object_id)
+        return jsonify({'status': 'success'})
+    starting = viewer_demand.watch(viewer_id, streamer_id, object_id) is not None
+    return jsonify({'status': 'success', 'starting': starting})
@@ -0,0 +1,94 @@
+import logging
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+from wowza.registry import RegistryBackend, get_registry
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class LazyExecutor:
+    # a thread pool started on first use, so each gunicorn worker gets its own threads after the fork
+    def __init__(self, max_workers: int, thread_name_prefix: str):
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix=self.thread_name_prefix)
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+class LeasedLoop:
+    # a daemon thread per worker that calls run_once() every interval seconds while this worker holds lease_name,
+    # so one worker does the job and the others take over the lease when it goes away
+    # the lease outlives a few cycles, lease_grace covers a cycle that runs long
+    lease_name: str
+    thread_name: str
+    job_name: str
+    lease_grace = 30.0
+
+    def __init__(self, interval: float, registry: RegistryBackend = None):
+        self.interval = interval
+        self._registry = registry
+        self.owner = uuid.uuid4().hex
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def registry(self) -> RegistryBackend:
+        return self._registry or get_registry()
+
+    def should_run(self) -> bool:
+        return self.interval > 0
+
+    def next_delay(self) -> float:
+        return self.interval
+
+    def lease_ttl(self) -> float:
+        return self.interval * 3 + self.lease_grace
+
+    def run_once(self):
+        raise NotImplementedError
+
+    def lease_lost(self):
+        # called on every cycle another worker holds the lease
+        ...
+
+    def run_if_leader(self) -> bool:
+        if not self.registry.try_lease(self.lease_name, self.owner, self.lease_ttl()):
+            self.lease_lost()
+            return False
+        try:
+            self.run_once()
+        except Exception as e:
+            logger.error(f"{self.job_name} failed: {str(e)}")
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.next_delay()):
+            self.run_if_leader()
+
+    def start(self):
+        if not self.should_run() or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,85 @@
+import logging
+import os
+import time
+from typing import Optional
+
+from wowza.registry import RegistryBackend, get_registry
+from wowza.wowzaclient import setup_lease_ttl, warm_pool_name
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# statuses of a stream that has, or is about to have, a wowza transcoder behind it
+holding_statuses = ('creating', 'initializing', 'ready')
+setting_up_statuses = ('creating', 'initializing')
+
+
+def abandoned_setup(record: dict, now: float = None) -> bool:
+    # the provisioning queue lives in one worker, a setup whose worker died never leaves creating/initializing;
+    # once its setup lease has run out nobody can still be working on it
+    if record.get('status') not in setting_up_statuses:
+        return False
+    status_at = record.get('status_at', record.get('last_active_at', 0))
+    return (now if now is not None else time.time()) - status_at > setup_lease_ttl
+
+
+class TranscoderCapacity:
+    # global and per-user limits on wowza transcoders, 0 means unlimited
+    # usage is counted from the shared registry, so every worker sees the same numbers
+    lease_name = 'transcoder-admission'
+
+    def __init__(self, max_transcoders: int = None, max_user_transcoders: int = None,
+                 registry: RegistryBackend = None):
+        self.max_transcoders = max_transcoders if max_transcoders is not None else int(
+            os.environ.get('MULTICAM_MAX_TRANSCODERS', 0))
+        self.max_user_transcoders = max_user_transcoders if max_user_transcoders is not None else int(
+            os.environ.get('MULTICAM_MAX_USER_TRANSCODERS', 0))
+        self._registry = registry
+
+    @property
+    def registry(self) -> RegistryBackend:
+        return self._registry or get_registry()
+
+    @property
+    def limited(self) -> bool:
+        return self.max_transcoders > 0 or self.max_user_transcoders > 0
+
+    def usage(self) -> tuple[int, dict[str, int]]:
+        by_user: dict[str, int] = {}
+        now = time.time()
+        for record in self.registry.records():
+            if record.get('status') in holding_statuses and not abandoned_setup(record, now):
+                user_id = str(record['user_id'])
+                by_user[user_id] = by_user.get(user_id, 0) + 1
+        # spares of the warm pool are live transcoders too, they just have no owner yet
+        return sum(by_user.values()) + self.registry.spare_count(warm_pool_name), by_user
+
+    def available(self, user_id=None, usage: tuple[int, dict[str, int]] = None) -> Optional[int]:
+        # free transcoders for the user, or for anyone when user_id is None, None when unlimited
+        # callers checking many users pass one usage() result instead of scanning the registry per check
+        total, by_user = usage if usage is not None else self.usage()
+        free = []
+        if self.max_transcoders > 0:
+            free.append(self.max_transcoders - total)
+        if user_id is not None and self.max_user_transcoders > 0:
+            free.append(self.max_user_transcoders - by_user.get(str(user_id), 0))
+        return max(min(free), 0) if free else None
+
+    def admits(self, user_id, usage: tuple[int, dict[str, int]] = None) -> bool:
+        available = self.available(user_id, usage)
+        return available is None or available > 0
+
+    def metrics(self) -> dict:
+        total, by_user = self.usage()
+        counters = self.registry.counters()
+        return {
+            'in_use': total,
+            'max_transcoders': self.max_transcoders,
+            'max_user_transcoders': self.max_user_transcoders,
+            'users_at_limit': sorted(user_id for user_id, count in by_user.items()
+                                     if 0 < self.max_user_transcoders <= count),
+            'admission_timeouts': counters.get('admission.timeouts', 0),
+        }
+
+
+transcoder_capacity = TranscoderCapacity()
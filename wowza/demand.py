@@ -0,0 +1,116 @@
+import logging
+import os
+import time
+from concurrent.futures import Future
+from typing import Optional
+
+from wowza.background import LazyExecutor, LeasedLoop
+from wowza.registry import RegistryBackend, default_angle, is_active, presence_channel
+from wowza.wowzaclient import WowzaFacade
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+on_demand_streams = os.environ.get('MULTICAM_ON_DEMAND_STREAMS', 'false').lower() in ('1', 'true', 'yes')
+
+
+class ViewerDemand(LeasedLoop):
+    # tracks which camera every viewer is watching, and in on-demand mode starts a non-default angle when its
+    # first viewer arrives and stops it once nobody has watched it for a cool-down
+    lease_name = 'viewer-demand'
+    thread_name = 'viewer-demand'
+    job_name = 'Stopping unwatched streams'
+
+    def __init__(self, enabled: bool = None, presence_ttl: float = None, cooldown: float = None,
+                 interval: float = None, registry: RegistryBackend = None):
+        super().__init__(interval if interval is not None else float(os.environ.get('MULTICAM_ON_DEMAND_INTERVAL', 15)),
+                         registry)
+        self.enabled = enabled if enabled is not None else on_demand_streams
+        self.presence_ttl = presence_ttl if presence_ttl is not None else float(
+            os.environ.get('MULTICAM_VIEWER_PRESENCE_TTL', 45))
+        self.cooldown = cooldown if cooldown is not None else float(os.environ.get('MULTICAM_ON_DEMAND_COOLDOWN', 120))
+        # (user_id, object_id) -> monotonic time the stream was first seen without viewers, leader only
+        self._unwatched_since: dict[tuple[str, str], float] = {}
+        self.executor = LazyExecutor(4, 'wowza-on-demand')
+
+    def watch(self, viewer_id: str, streamer_id, object_id: str) -> Optional[Future]:
+        # called on every heartbeat of the watch page, a viewer is present on one angle of a streamer at a time
+        records = self.registry.user_records(streamer_id)
+        record = next((record for record in records if record['object_id'] == str(object_id)), None)
+        if record is None:
+            return None
+        for other in records:
+            if other is not record:
+                self.registry.drop_presence(presence_channel(streamer_id, other['object_id']), viewer_id)
+        self.registry.touch_presence(presence_channel(streamer_id, object_id), viewer_id, self.presence_ttl)
+        if not self.enabled or not record['initialized'] or is_active(record):
+            return None
+        default = default_angle(records)
+        if record['object_id'] == default['object_id']:
+            return None
+        if not is_active(default):
+            # the streamer is offline, viewers must not be able to keep paid transcoders running for the channel
+            return None
+        logger.info(f"Starting stream {object_id} of user {streamer_id} for its first viewer")
+        return self.executor.submit(self._start, record)
+
+    def leave(self, viewer_id: str, streamer_id, object_id: str):
+        self.registry.drop_presence(presence_channel(streamer_id, object_id), viewer_id)
+
+    def viewer_counts(self, streamer_id) -> dict[str, int]:
+        counts = self.registry.presence_counts()
+        return {record['object_id']: counts.get(presence_channel(streamer_id, record['object_id']), 0)
+                for record in self.registry.user_records(streamer_id)}
+
+    def _start(self, record: dict):
+        try:
+            result = WowzaFacade._hydrate(record).listen_to_stream()
+        except Exception as e:
+            logger.error(f"Could not start stream {record['object_id']} for its first viewer: {str(e)}")
+            return None
+        self.registry.incr_counter('on_demand.started')
+        return result
+
+    def stop_unwatched_once(self) -> list[str]:
+        now = time.monotonic()
+        counts = self.registry.presence_counts()
+        stopped = []
+        candidates = set()
+        for user_id in self.registry.active_user_ids():
+            records = self.registry.user_records(user_id)
+            default = default_angle(records)
+            for record in records:
+                if not is_active(record) or record['object_id'] == default['object_id']:
+                    continue
+                key = (str(user_id), record['object_id'])
+                if counts.get(presence_channel(*key)):
+                    continue
+                candidates.add(key)
+                if now - self._unwatched_since.setdefault(key, now) < self.cooldown:
+                    continue
+                try:
+                    WowzaFacade._hydrate(record).stop_stream(touch=False)
+                except Exception as e:
+                    logger.error(f"Could not stop unwatched stream {record['object_id']}: {str(e)}")
+                    continue
+                stopped.append(record['object_id'])
+                candidates.discard(key)
+        # streams that got a viewer back, were stopped or were removed start their cool-down from scratch
+        self._unwatched_since = {key: since for key, since in self._unwatched_since.items() if key in candidates}
+        if stopped:
+            self.registry.incr_counter('on_demand.stopped', len(stopped))
+            logger.info(f"Stopped {len(stopped)} streams nobody watched for {self.cooldown}s: {stopped}")
+        return stopped
+
+    def should_run(self) -> bool:
+        return self.enabled and super().should_run()
+
+    def run_once(self):
+        self.stop_unwatched_once()
+
+    def lease_lost(self):
+        # another worker is the leader, its cool-down clocks are the ones that count
+        self._unwatched_since.clear()
+
+
+viewer_demand = ViewerDemand()
@@ -0,0 +1,70 @@
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+from wowza.registry import RegistryBackend, get_registry, is_active
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# events that can change whether a streamer has a camera on air
+live_event_types = ('camera_started', 'camera_stopped', 'camera_added', 'camera_removed')
+
+
+class LiveStreamerIndex:
+    # ids of the streamers with at least one active camera, kept in this worker and moved forward by the stream
+    # events since the last read instead of rescanning the registry on every render
+    # a full reload every resync_interval seconds covers events that aged out of the log before they were read
+    def __init__(self, resync_interval: float = None, registry: RegistryBackend = None):
+        self.resync_interval = resync_interval if resync_interval is not None else float(
+            os.environ.get('MULTICAM_LIVE_INDEX_RESYNC', 60))
+        self._registry = registry
+        self._live: frozenset[str] = frozenset()
+        self._cursor = 0
+        self._synced_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def registry(self) -> RegistryBackend:
+        return self._registry or get_registry()
+
+    def _resync(self):
+        # the cursor is read first, events published during the reload are applied again on the next catch up
+        self._cursor = self.registry.last_event_id()
+        self._live = frozenset(str(user_id) for user_id in self.registry.active_user_ids())
+        self._synced_at = time.monotonic()
+
+    def _catch_up(self):
+        events = self.registry.events_since(self._cursor)
+        if not events:
+            return
+        self._cursor = events[-1][0]
+        touched = {event['user_id'] for _, event in events if event.get('type') in live_event_types
+                   and 'user_id' in event}
+        if not touched:
+            return
+        live = set(self._live)
+        for user_id in touched:
+            # a stop only takes the streamer off air when none of their other cameras is still running
+            if any(is_active(record) for record in self.registry.user_records(user_id)):
+                live.add(user_id)
+            else:
+                live.discard(user_id)
+        self._live = frozenset(live)
+
+    def live_ids(self) -> frozenset[str]:
+        with self._lock:
+            if self._synced_at is None or time.monotonic() - self._synced_at >= self.resync_interval:
+                self._resync()
+            else:
+                self._catch_up()
+            return self._live
+
+    def live_among(self, user_ids) -> frozenset[str]:
+        # set intersection walks the smaller of the two sets, so this costs O(min(n, m)) per render
+        return self.live_ids() & frozenset(user_ids)
+
+
+live_streamers = LiveStreamerIndex()
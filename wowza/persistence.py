@@ -0,0 +1,138 @@
+import atexit
+import json
+import logging
+import os
+from typing import Optional
+
+from flask import Flask
+from sqlalchemy import tuple_
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import Stream, db
+from wowza.background import LeasedLoop
+from wowza.registry import RegistryBackend, is_active
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def stream_from_record(record: dict) -> Stream:
+    return Stream(
+        object_id=record['object_id'],
+        cam_angle=record.get('cam_angle'),
+        cam_label=record.get('cam_label'),
+        stream_name=record.get('stream_name'),
+        stream_id=record.get('stream_id'),
+        password=record.get('password'),
+        user_name=record.get('username'),
+        embed_code=record.get('embed_code'),
+        hls=record.get('hls'),
+        primary_server=record.get('primary_server'),
+        encoding_profile=record.get('encoding_profile'),
+        broadcast_location=record.get('broadcast_location'),
+        registered_at=record.get('registered_at'),
+        last_active_at=record.get('last_active_at'),
+        user_id=int(record['user_id']),
+        active=is_active(record),
+    )
+
+
+def record_from_stream(stream: Stream) -> dict:
+    record = {
+        'user_id': stream.user_id,
+        'initialized': True,
+        'error': None,
+        'object_id': stream.object_id,
+        'stream_id': stream.stream_id,
+        'stream_name': stream.stream_name,
+        'stream_state': stream.active,
+        'username': stream.user_name,
+        'password': stream.password,
+        'embed_code': stream.embed_code,
+        'hls': stream.hls,
+        'primary_server': stream.primary_server,
+        'cam_angle': stream.cam_angle,
+        'cam_label': stream.cam_label,
+        'encoding_profile': stream.encoding_profile,
+        'broadcast_location': stream.broadcast_location,
+        'status': 'ready',
+    }
+    # rows stored before these were tracked leave them out, so the registry's defaults apply
+    for field in ('registered_at', 'last_active_at'):
+        if getattr(stream, field) is not None:
+            record[field] = getattr(stream, field)
+    return record
+
+
+class StreamPersister(LeasedLoop):
+    # writes registry changes behind to the Stream table in batches, and reloads the registry from it on startup
+    lease_name = 'stream-persister'
+    thread_name = 'stream-persister'
+    job_name = 'Stream persistence'
+
+    def __init__(self, interval: float = None, registry: RegistryBackend = None):
+        super().__init__(interval if interval is not None else float(os.environ.get('MULTICAM_PERSIST_INTERVAL', 5)),
+                         registry)
+        self.app: Optional[Flask] = None
+        # (user_id, object_id) -> the record as last written, None until this process knows what the table holds
+        self._synced: Optional[dict[tuple[str, str], Optional[str]]] = None
+
+    def flush(self) -> tuple[int, int]:
+        # only provisioned streams are worth keeping, pending setups are retried by the streamer
+        records = {(str(record['user_id']), record['object_id']): record for record in self.registry.records()
+                   if record['initialized']}
+        if self._synced is None:
+            self._synced = {(str(user_id), object_id): None for user_id, object_id in
+                            db.session.execute(db.select(Stream.user_id, Stream.object_id))}
+        snapshots = {key: json.dumps(record, sort_keys=True) for key, record in records.items()}
+        changed = [key for key, snapshot in snapshots.items() if self._synced.get(key) != snapshot]
+        removed = [key for key in self._synced if key not in records]
+        if not changed and not removed:
+            return 0, 0
+        try:
+            for key in changed:
+                db.session.merge(stream_from_record(records[key]))
+            if removed:
+                db.session.execute(db.delete(Stream).where(tuple_(Stream.user_id, Stream.object_id).in_(
+                    [(int(user_id), object_id) for user_id, object_id in removed])))
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            raise
+        for key in changed:
+            self._synced[key] = snapshots[key]
+        for key in removed:
+            del self._synced[key]
+        logger.info(f"Persisted {len(changed)} streams, removed {len(removed)}")
+        return len(changed), len(removed)
+
+    def rehydrate(self) -> int:
+        # bulk load every stored stream the registry does not know about yet, e.g. after a restart
+        try:
+            streams = db.session.execute(db.select(Stream)).scalars().all()
+        except SQLAlchemyError as e:
+            logger.error(f"Could not load streams for the registry: {e}")
+            db.session.rollback()
+            return 0
+        known = {(str(record['user_id']), record['object_id']) for record in self.registry.records()}
+        missing = [record_from_stream(stream) for stream in streams
+                   if (str(stream.user_id), stream.object_id) not in known]
+        if missing:
+            self.registry.put_many(missing)
+            logger.info(f"Rehydrated {len(missing)} streams into the registry")
+        return len(missing)
+
+    def run_once(self):
+        with self.app.app_context():
+            self.flush()
+
+    def start(self, app: Flask):
+        if not self.should_run() or (self._thread is not None and self._thread.is_alive()):
+            return
+        self.app = app
+        super().start()
+        # last changes are written when the worker shuts down cleanly
+        atexit.register(self.run_if_leader)
+
+
+stream_persister = StreamPersister()
@@ -0,0 +1,17 @@
+import os
+
+# live_stream fields of each named encoding profile, merged into the create request by WowzaClientConfig.construct
+encoding_profiles = {
+    # adaptive bitrate ladder transcoded from a 720p source, plays everywhere but costs a full transcoder
+    'transcoded': {'transcoder_type': 'transcoded', 'aspect_ratio_width': 1280, 'aspect_ratio_height': 720},
+    # transcoded from a 360p source, a short and cheap ladder for angles that are mostly seen as a thumbnail
+    'preview': {'transcoder_type': 'transcoded', 'aspect_ratio_width': 640, 'aspect_ratio_height': 360},
+    # the camera's own encoding is relayed as is, no transcode cost and the fastest angle switches
+    'passthrough': {'transcoder_type': 'passthrough', 'aspect_ratio_width': 1280, 'aspect_ratio_height': 720,
+                    'low_latency': True},
+}
+default_encoding_profile = os.environ.get('MULTICAM_DEFAULT_ENCODING_PROFILE', 'transcoded')
+if default_encoding_profile not in encoding_profiles:
+    # every WowzaClient is built with the default profile, a typo would only surface as a KeyError per request
+    raise EnvironmentError(f"MULTICAM_DEFAULT_ENCODING_PROFILE must be one of {', '.join(encoding_profiles)}, "
+                           f"got {default_encoding_profile!r}")
@@ -0,0 +1,206 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from typing import Optional
+
+from wowza.background import LazyExecutor
+from wowza.capacity import TranscoderCapacity, holding_statuses, transcoder_capacity
+from wowza.registry import get_registry
+from wowza.wowzaclient import WowzaFacade
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class _Job:
+    __slots__ = ('future', 'wowza_service', 'user_id', 'priority', 'queued_at')
+
+    def __init__(self, wowza_service: WowzaFacade, priority: bool):
+        self.future = Future()
+        self.wowza_service = wowza_service
+        self.user_id = str(wowza_service.user_id)
+        self.priority = priority
+        self.queued_at = time.monotonic()
+
+
+class ProvisioningQueue:
+    # runs WowzaFacade.setup() on a small worker pool so the request thread only registers the job
+    # jobs wait in a fair queue until a worker and a transcoder are free: default angles first, then one job per
+    # user in turn, so one streamer adding many cameras cannot starve the others
+    def __init__(self, max_workers: int = None, capacity: TranscoderCapacity = None, admission_timeout: float = None,
+                 poll_interval: float = 1.0):
+        self.max_workers = max_workers or int(os.environ.get('MULTICAM_PROVISIONING_WORKERS', 4))
+        self.capacity = capacity or transcoder_capacity
+        self.admission_timeout = admission_timeout if admission_timeout is not None else float(
+            os.environ.get('MULTICAM_ADMISSION_TIMEOUT', 300))
+        self.poll_interval = poll_interval
+        self.owner = uuid.uuid4().hex
+        self.executor = LazyExecutor(self.max_workers, 'wowza-provisioning')
+        self._changed = threading.Condition()
+        self._priority: deque[_Job] = deque()
+        # user_id -> queued jobs, in the order the users get their next turn
+        self._queued: dict[str, deque[_Job]] = {}
+        self._running = 0
+        self._dispatcher: Optional[threading.Thread] = None
+
+    def submit(self, user_id, object_id: str, cam_angle: str = None, cam_label: str = None,
+               encoding_profile: str = None, region_hint: str = None, region_rtts: dict = None) -> Future:
+        # the job id is the object id, its progress is the status field of the stream's registry record
+        wowza_service = WowzaFacade(user_id=user_id, object_id=object_id, cam_angle=cam_angle, cam_label=cam_label,
+                                    encoding_profile=encoding_profile, region_hint=region_hint,
+                                    region_rtts=region_rtts)
+        job = _Job(wowza_service, priority=self._is_default_angle(wowza_service))
+        with self._changed:
+            if job.priority:
+                self._priority.append(job)
+            else:
+                self._queued.setdefault(job.user_id, deque()).append(job)
+            if self._dispatcher is None or not self._dispatcher.is_alive():
+                self._dispatcher = threading.Thread(target=self._dispatch, name='wowza-provisioning-dispatcher',
+                                                    daemon=True)
+                self._dispatcher.start()
+            self._changed.notify_all()
+        logger.info(f"Queued provisioning job {object_id} for user {user_id}"
+                    f"{' with priority' if job.priority else ''}")
+        return job.future
+
+    def submit_batch(self, user_id, cameras: list[dict]) -> dict[Future, str]:
+        # every camera is its own job, the pool bounds how many provision at once
+        return {self.submit(user_id=user_id, object_id=camera['object_id'], cam_angle=camera['cam_angle'],
+                            cam_label=camera['cam_label'], encoding_profile=camera.get('encoding_profile'),
+                            region_hint=camera.get('region_hint'), region_rtts=camera.get('region_rtts')):
+                camera['object_id'] for camera in cameras}
+
+    @staticmethod
+    def _is_default_angle(wowza_service: WowzaFacade) -> bool:
+        # the first camera of a streamer is what viewers land on, it goes ahead of everyone's extra angles
+        return not any(record['object_id'] != wowza_service.object_id and record.get('status') != 'failed'
+                       and record.get('registered_at', 0) <= wowza_service.registered_at
+                       for record in get_registry().user_records(wowza_service.user_id))
+
+    def queued(self) -> int:
+        with self._changed:
+            return len(self._priority) + sum(len(jobs) for jobs in self._queued.values())
+
+    def _candidates(self):
+        yield from self._priority
+        for jobs in self._queued.values():
+            yield jobs[0]
+
+    def _take(self, job: _Job):
+        if job.priority:
+            self._priority.remove(job)
+            return
+        jobs = self._queued.pop(job.user_id)
+        jobs.popleft()
+        if jobs:
+            # back of the line for this user's next camera
+            self._queued[job.user_id] = jobs
+
+    def _expire(self) -> list[_Job]:
+        if self.admission_timeout <= 0:
+            return []
+        deadline = time.monotonic() - self.admission_timeout
+        expired = [job for job in self._candidates() if job.queued_at < deadline]
+        for job in expired:
+            self._take(job)
+        return expired
+
+    def _admit(self, usage: Optional[tuple[int, dict[str, int]]]) -> list[tuple[_Job, bool]]:
+        # called with the queue lock held, admits jobs while workers are free against the usage read for this pass
+        # and counts every admitted transcoder into it, so the registry is scanned once per pass, not per candidate
+        admitted = []
+        while self._running < self.max_workers:
+            for job in self._candidates():
+                # a stream that already holds its transcoder, e.g. a retried job id, only joins its own setup
+                needs_transcoder = usage is not None and job.wowza_service.status not in holding_statuses
+                if not needs_transcoder or self.capacity.admits(job.user_id, usage):
+                    break
+            else:
+                break
+            self._take(job)
+            self._running += 1
+            admitted.append((job, needs_transcoder))
+            if needs_transcoder:
+                total, by_user = usage
+                by_user[job.user_id] = by_user.get(job.user_id, 0) + 1
+                usage = (total + 1, by_user)
+        return admitted
+
+    def _dispatch_once(self) -> bool:
+        # the admission lease makes the usage read and the status writes atomic across workers, the usage scan and
+        # the registry writes happen outside the queue lock so submit() never waits behind them
+        limited = self.capacity.limited
+        if limited and not self.capacity.registry.try_lease(self.capacity.lease_name, self.owner, 10):
+            return False
+        try:
+            usage = self.capacity.usage() if limited else None
+            with self._changed:
+                expired = self._expire()
+                admitted = self._admit(usage)
+            for job, needs_transcoder in admitted:
+                if needs_transcoder:
+                    # counts against the limits from now on, before the worker thread gets to it
+                    job.wowza_service._set_status('creating')
+        finally:
+            if limited:
+                self.capacity.registry.release_lease(self.capacity.lease_name, self.owner)
+        for stale in expired:
+            self._reject(stale)
+        for job, _ in admitted:
+            if job.future.set_running_or_notify_cancel():
+                self.executor.submit(self._run_job, job)
+            else:
+                self._finished()
+        return bool(admitted or expired)
+
+    def _dispatch(self):
+        while True:
+            with self._changed:
+                while self._running >= self.max_workers or not (self._priority or self._queued):
+                    self._changed.wait()
+            try:
+                progressed = self._dispatch_once()
+            except Exception as e:
+                logger.error(f"Transcoder admission failed: {str(e)}")
+                progressed = False
+            if not progressed:
+                with self._changed:
+                    self._changed.wait(self.poll_interval)
+
+    @staticmethod
+    def _reject(job: _Job):
+        logger.warning(f"Provisioning job {job.wowza_service.object_id} gave up waiting for a transcoder")
+        get_registry().incr_counter('admission.timeouts')
+        job.wowza_service._set_status('failed', 'No transcoder capacity available, try again later')
+        job.future.set_result('failed')
+
+    def _finished(self):
+        with self._changed:
+            self._running -= 1
+            self._changed.notify_all()
+
+    def _run_job(self, job: _Job):
+        try:
+            job.future.set_result(self._run(job.wowza_service))
+        finally:
+            self._finished()
+
+    @staticmethod
+    def _run(wowza_service: WowzaFacade):
+        try:
+            return wowza_service.setup()
+        except Exception as e:
+            logger.error(f"Provisioning job {wowza_service.object_id} crashed: {str(e)}")
+            wowza_service._set_status('failed', str(e))
+            return 'failed'
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
+
+
+provisioning_queue = ProvisioningQueue()
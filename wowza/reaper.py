@@ -0,0 +1,141 @@
+import logging
+import os
+import time
+from typing import Optional
+
+from wowza.background import LeasedLoop
+from wowza.registry import RegistryBackend, is_active, presence_channel
+from wowza.capacity import abandoned_setup
+from wowza.wowzaclient import WowzaClient, WowzaFacade, setup_lease_name, setup_lease_ttl
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class StreamReaper(LeasedLoop):
+    # stops streams nobody has touched or watched for idle_ttl seconds and keeps the registry under max_streams
+    # entries; a stream with viewers counts as active, so a broadcast is never stopped in the middle of a show
+    lease_name = 'stream-reaper'
+    thread_name = 'stream-reaper'
+    job_name = 'Stream reaping'
+
+    def __init__(self, idle_ttl: float = None, max_streams: int = None, interval: float = None,
+                 registry: RegistryBackend = None):
+        super().__init__(interval if interval is not None else float(os.environ.get('MULTICAM_REAP_INTERVAL', 60)),
+                         registry)
+        self.idle_ttl = idle_ttl if idle_ttl is not None else float(os.environ.get('MULTICAM_IDLE_STREAM_TTL', 4 * 3600))
+        self.max_streams = max_streams if max_streams is not None else int(os.environ.get('MULTICAM_MAX_STREAMS', 1000))
+
+    @staticmethod
+    def _stop_stream(record: dict) -> bool:
+        try:
+            WowzaFacade._hydrate(record).stop_stream(touch=False)
+            return True
+        except Exception as e:
+            logger.error(f"Could not stop idle stream {record['object_id']}: {str(e)}")
+            return False
+
+    @staticmethod
+    def _evict(record: dict) -> bool:
+        # the wowza stream goes with its record, nothing could manage or reach it anymore
+        # a stream wowza would not delete keeps its record, so the next pass tries again
+        if record.get('stream_id'):
+            try:
+                WowzaClient().delete_live_stream(record['stream_id'])
+            except Exception as e:
+                logger.error(f"Could not delete evicted stream {record['stream_id']} on wowza: {str(e)}")
+                return False
+        WowzaFacade.delete_instance(record['user_id'], record['object_id'])
+        return True
+
+    def _fail_abandoned_setup(self, record: dict) -> bool:
+        # taking the setup lease proves no worker is still on it, the streamer can then retry the camera
+        lease = setup_lease_name(record['user_id'], record['object_id'])
+        if not self.registry.try_lease(lease, self.owner, setup_lease_ttl):
+            return False
+        try:
+            current = self.registry.get(record['user_id'], record['object_id'])
+            if current is None or not abandoned_setup(current):
+                return False
+            current['status'] = 'failed'
+            current['status_at'] = time.time()
+            current['error'] = 'Stream setup was interrupted, try again'
+            self.registry.put(current)
+            return True
+        finally:
+            self.registry.release_lease(lease, self.owner)
+
+    def _touch(self, record: dict, now: float) -> Optional[dict]:
+        # re-read so a setup/listen/stop that landed since the scan keeps its fields, only the timestamp changes
+        current = self.registry.get(record['user_id'], record['object_id'])
+        if current is None:
+            return None
+        current['last_active_at'] = now
+        self.registry.put(current)
+        return current
+
+    def reap_once(self) -> dict:
+        now = time.time()
+        report = {'stopped': [], 'evicted': [], 'failed': []}
+        watched = self.registry.presence_counts()
+        records = []
+        for record in self.registry.records():
+            if abandoned_setup(record, now) and self._fail_abandoned_setup(record):
+                report['failed'].append(record['object_id'])
+                continue
+            if 'last_active_at' not in record or presence_channel(record['user_id'], record['object_id']) in watched:
+                # records written before activity tracking start their idle clock now, watched ones restart it
+                record = self._touch(record, now)
+                if record is None:
+                    continue
+            records.append(record)
+
+        idle_before = now - self.idle_ttl
+        survivors = []
+        for record in records:
+            if record['last_active_at'] >= idle_before:
+                survivors.append(record)
+            elif not record['initialized']:
+                # a setup that never finished and was abandoned
+                if self._evict(record):
+                    report['evicted'].append(record['object_id'])
+                else:
+                    survivors.append(record)
+            elif is_active(record):
+                if self._stop_stream(record):
+                    report['stopped'].append(record['object_id'])
+                survivors.append(record)
+            else:
+                survivors.append(record)
+
+        overflow = len(survivors) - self.max_streams
+        if self.max_streams > 0 and overflow > 0:
+            # least recently used first
+            for record in sorted(survivors, key=lambda record: record['last_active_at'])[:overflow]:
+                if is_active(record):
+                    self._stop_stream(record)
+                if self._evict(record):
+                    report['evicted'].append(record['object_id'])
+
+        if report['stopped'] or report['evicted'] or report['failed']:
+            self.registry.incr_counter('reaper.stopped', len(report['stopped']))
+            self.registry.incr_counter('reaper.evicted', len(report['evicted']))
+            self.registry.incr_counter('reaper.failed_setups', len(report['failed']))
+            logger.info(f"Reaper stopped {len(report['stopped'])} idle streams, evicted "
+                        f"{len(report['evicted'])} registry entries and failed {len(report['failed'])} "
+                        f"abandoned setups: {report}")
+        return report
+
+    def run_once(self):
+        self.reap_once()
+
+    def run_if_leader(self) -> bool:
+        # every worker forgets the facades of streams evicted anywhere, only the lease holder reaps
+        try:
+            WowzaFacade.prune_instances()
+        except Exception as e:
+            logger.error(f"Pruning cached stream facades failed: {str(e)}")
+        return super().run_if_leader()
+
+
+stream_reaper = StreamReaper()
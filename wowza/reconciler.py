@@ -0,0 +1,76 @@
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from wowza.background import LeasedLoop
+from wowza.registry import RegistryBackend
+from wowza.wowzaclient import WowzaClient
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# wowza live stream states mapped onto the boolean stream_state the registry and viewers use
+wowza_active_states = {'started': True, 'starting': True, 'stopped': False, 'stopping': False, 'resetting': False}
+
+
+class StreamStateReconciler(LeasedLoop):
+    # periodically asks wowza for the real state of every registered stream and writes it back to the registry
+    lease_name = 'stream-state-reconciler'
+    thread_name = 'wowza-reconciler'
+    job_name = 'Stream state reconciliation'
+
+    def __init__(self, interval: float = None, jitter: float = None, max_concurrency: int = None,
+                 registry: RegistryBackend = None):
+        super().__init__(interval if interval is not None else float(os.environ.get('MULTICAM_RECONCILE_INTERVAL', 30)),
+                         registry)
+        self.jitter = jitter if jitter is not None else float(os.environ.get('MULTICAM_RECONCILE_JITTER', 5))
+        self.max_concurrency = max_concurrency or int(os.environ.get('MULTICAM_RECONCILE_CONCURRENCY', 4))
+
+    @staticmethod
+    def fetch_state(stream_id: str) -> Optional[str]:
+        return WowzaClient().get_state_of_stream(stream_id).state
+
+    def _reconcile_record(self, record: dict) -> bool:
+        try:
+            state = self.fetch_state(record['stream_id'])
+        except Exception as e:
+            logger.error(f"Could not refresh state of stream {record['stream_id']}: {str(e)}")
+            return False
+        if state not in wowza_active_states:
+            return False
+        stream_state = wowza_active_states[state]
+        # re-read so a listen/stop that landed while we were polling is not overwritten with older fields
+        current = self.registry.get(record['user_id'], record['object_id'])
+        if current is None or current['stream_state'] is stream_state:
+            return False
+        current['stream_state'] = stream_state
+        if stream_state:
+            # a start seen on wowza, e.g. from the encoder side, is activity the reaper must not count as idle time
+            current['last_active_at'] = time.time()
+        self.registry.put(current)
+        return True
+
+    def reconcile_once(self) -> int:
+        records = [record for record in self.registry.records() if record['initialized'] and record['stream_id']]
+        if not records:
+            return 0
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='wowza-reconcile') as executor:
+            changed = sum(executor.map(self._reconcile_record, records))
+        logger.info(f"Reconciled {len(records)} streams, {changed} changed state")
+        return changed
+
+    def run_once(self):
+        self.reconcile_once()
+
+    def next_delay(self) -> float:
+        # jitter keeps the workers of several nodes from polling wowza in lockstep
+        return max(1.0, self.interval + random.uniform(-self.jitter, self.jitter))
+
+    def lease_ttl(self) -> float:
+        return self.interval + self.jitter * 2 + self.lease_grace
+
+
+stream_reconciler = StreamStateReconciler()
@@ -0,0 +1,60 @@
+import logging
+import os
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# wowza streaming cloud broadcast locations a live stream can ingest in
+broadcast_locations = (
+    'asia_pacific_australia', 'asia_pacific_india', 'asia_pacific_japan', 'asia_pacific_singapore',
+    'asia_pacific_s_korea', 'asia_pacific_taiwan', 'eu_belgium', 'eu_germany', 'eu_ireland',
+    'south_america_brazil', 'us_central_iowa', 'us_east_s_carolina', 'us_east_virginia', 'us_west_california',
+    'us_west_oregon',
+)
+default_broadcast_location = os.environ.get('MULTICAM_DEFAULT_BROADCAST_LOCATION', 'us_west_oregon')
+
+
+def parse_region_map(value: str) -> dict[str, str]:
+    # "us_west_oregon=80,eu_germany=https://probe.example/ping" -> {"us_west_oregon": "80", ...}
+    pairs = (item.split('=', 1) for item in value.split(',') if '=' in item)
+    return {region.strip(): setting.strip() for region, setting in pairs if region.strip() in broadcast_locations}
+
+
+class RegionSelector:
+    # picks the ingest region of a new live stream with the lowest round trip time from the streamer's encoder
+    # measurements come from the streamer's browser, which times requests to the probe urls of each region, and
+    # are merged over the static rtts configured for the deployment
+    def __init__(self, rtts: dict[str, float] = None, probes: dict[str, str] = None, default: str = None):
+        if rtts is None:
+            rtts = {region: float(rtt) for region, rtt in
+                    parse_region_map(os.environ.get('MULTICAM_REGION_RTTS', '')).items()}
+        self.rtts = rtts
+        # region -> url the browser times, point them at a local stub to test the selection end to end
+        self.probes = probes if probes is not None else parse_region_map(os.environ.get('MULTICAM_REGION_PROBES', ''))
+        self.default = default or default_broadcast_location
+
+    @staticmethod
+    def clean_rtts(measured) -> dict[str, float]:
+        # drops unknown regions and anything that is not a positive number, measured comes straight from a request
+        if not isinstance(measured, dict):
+            return {}
+        rtts = {}
+        for region, rtt in measured.items():
+            if region in broadcast_locations and isinstance(rtt, (int, float)) and not isinstance(rtt, bool) \
+                    and rtt > 0:
+                rtts[region] = float(rtt)
+        return rtts
+
+    def select(self, hint: str = None, measured: dict[str, float] = None) -> str:
+        # an explicit region from the streamer wins, then the fastest measured or configured region
+        if hint in broadcast_locations:
+            return hint
+        rtts = {**self.rtts, **self.clean_rtts(measured or {})}
+        if not rtts:
+            return self.default
+        region = min(rtts, key=rtts.get)
+        logger.info(f"Selected broadcast location {region} at {rtts[region]:.0f}ms")
+        return region
+
+
+region_selector = RegionSelector()
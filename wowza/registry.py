@@ -0,0 +1,676 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Optional
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+default_registry_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance',
+                                     'registry.db')
+
+
+def _key(user_id, object_id) -> tuple[str, str]:
+    # user ids arrive as int from flask-login and as str from query strings/json bodies
+    return str(user_id), str(object_id)
+
+
+def is_active(record: dict) -> bool:
+    return record.get('stream_state') is True
+
+
+def default_angle(records: list[dict]) -> Optional[dict]:
+    # the first camera a streamer registered is the one viewers land on, it is never started or stopped on demand
+    cameras = [record for record in records if record.get('initialized')]
+    return min(cameras, key=lambda record: record.get('registered_at', 0)) if cameras else None
+
+
+def presence_channel(user_id, object_id) -> str:
+    return '{}:{}'.format(*_key(user_id, object_id))
+
+
+def stream_events(before: Optional[dict], after: Optional[dict]) -> list[dict]:
+    # what viewers of the streamer need to hear about when a record goes from before to after
+    events = []
+    was_available = before is not None and before.get('initialized')
+    is_available = after is not None and after.get('initialized')
+    if is_available and not was_available:
+        events.append({'type': 'camera_added', 'stream': StreamRegistryQuery.to_viewer(after)})
+    elif was_available and after is None:
+        events.append({'type': 'camera_removed', 'stream': StreamRegistryQuery.to_viewer(before)})
+    if before is not None and after is not None and is_active(before) != is_active(after):
+        events.append({'type': 'camera_started' if is_active(after) else 'camera_stopped',
+                       'stream': StreamRegistryQuery.to_viewer(after)})
+    return events
+
+
+class RegistryBackend(ABC):
+    # stores one serialized stream record per (user_id, object_id), shared by every facade that reads it
+
+    @abstractmethod
+    def get(self, user_id, object_id) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def put(self, record: dict) -> Optional[dict]:
+        # returns the record that was replaced, if any
+        ...
+
+    @abstractmethod
+    def delete(self, user_id, object_id) -> Optional[dict]:
+        # returns the record that was removed, if any
+        ...
+
+    def put_many(self, records: list[dict]):
+        for record in records:
+            self.put(record)
+
+    @abstractmethod
+    def records(self) -> list[dict]:
+        ...
+
+    @abstractmethod
+    def user_records(self, user_id) -> list[dict]:
+        ...
+
+    @abstractmethod
+    def records_by_state(self, state) -> list[dict]:
+        ...
+
+    @abstractmethod
+    def user_ids(self) -> set:
+        ...
+
+    @abstractmethod
+    def active_user_ids(self) -> set:
+        ...
+
+    @abstractmethod
+    def try_lease(self, name: str, owner: str, ttl: float) -> bool:
+        # take or renew a named lease so only one worker runs a periodic job at a time
+        ...
+
+    @abstractmethod
+    def release_lease(self, name: str, owner: str):
+        ...
+
+    @abstractmethod
+    def touch_presence(self, channel: str, member: str, ttl: float):
+        # a member counts as present on the channel until ttl seconds after its last touch
+        ...
+
+    @abstractmethod
+    def drop_presence(self, channel: str, member: str):
+        ...
+
+    @abstractmethod
+    def presence_counts(self) -> dict[str, int]:
+        # members still present by channel, channels nobody is on are left out
+        ...
+
+    @abstractmethod
+    def publish(self, user_id, event: dict) -> int:
+        ...
+
+    @abstractmethod
+    def events_since(self, after_id: int, user_id=None) -> list[tuple[int, dict]]:
+        ...
+
+    @abstractmethod
+    def last_event_id(self) -> int:
+        ...
+
+    @abstractmethod
+    def push_spare(self, pool: str, entry: dict):
+        # pre-created wowza streams waiting to be claimed by a setup
+        ...
+
+    @abstractmethod
+    def claim_spare(self, pool: str) -> Optional[dict]:
+        # removes and returns the oldest spare, a spare is handed to exactly one caller
+        ...
+
+    @abstractmethod
+    def spare_count(self, pool: str) -> int:
+        ...
+
+    @abstractmethod
+    def incr_counter(self, name: str, amount: float = 1) -> float:
+        ...
+
+    @abstractmethod
+    def counters(self) -> dict[str, float]:
+        ...
+
+    def wait_for_events(self, after_id: int, user_id=None, timeout: float = 15.0,
+                        poll_interval: float = 0.5) -> list[tuple[int, dict]]:
+        deadline = time.monotonic() + timeout
+        while True:
+            events = self.events_since(after_id, user_id)
+            if events or time.monotonic() >= deadline:
+                return events
+            time.sleep(poll_interval)
+
+    def _publish_changes(self, before: Optional[dict], after: Optional[dict]):
+        record = after if after is not None else before
+        for event in stream_events(before, after):
+            # the streamer travels with the event so consumers reading every user's events can tell them apart
+            self.publish(record['user_id'], {**event, 'user_id': str(record['user_id'])})
+
+
+class LocalRegistryBackend(RegistryBackend):
+    # process-local stand-in for a redis-style key/value store, only shared between threads of one worker
+    # records are stored under a per-user index and a per-state index so lookups cost O(result)
+    def __init__(self):
+        self._by_user: dict[str, dict[str, dict]] = {}
+        self._by_state: dict = {}
+        self._leases: dict[str, tuple[str, float]] = {}
+        self._presence: dict[str, dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self._events: deque[tuple[int, str, dict]] = deque(maxlen=1000)
+        self._event_id = 0
+        self._events_changed = threading.Condition()
+        self._spares: dict[str, deque[dict]] = {}
+        self._counters: dict[str, float] = {}
+
+    def _unindex(self, user_id: str, object_id: str) -> Optional[dict]:
+        user_records = self._by_user.get(user_id)
+        if user_records is None or object_id not in user_records:
+            return None
+        record = user_records.pop(object_id)
+        if not user_records:
+            del self._by_user[user_id]
+        state_keys = self._by_state[record['stream_state']]
+        state_keys.discard((user_id, object_id))
+        if not state_keys:
+            del self._by_state[record['stream_state']]
+        return record
+
+    def get(self, user_id, object_id) -> Optional[dict]:
+        user_id, object_id = _key(user_id, object_id)
+        with self._lock:
+            record = self._by_user.get(user_id, {}).get(object_id)
+            return dict(record) if record is not None else None
+
+    def put(self, record: dict):
+        user_id, object_id = _key(record['user_id'], record['object_id'])
+        record = dict(record)
+        with self._lock:
+            before = self._unindex(user_id, object_id)
+            self._by_user.setdefault(user_id, {})[object_id] = record
+            self._by_state.setdefault(record['stream_state'], set()).add((user_id, object_id))
+        self._publish_changes(before, record)
+        return before
+
+    def delete(self, user_id, object_id) -> Optional[dict]:
+        with self._lock:
+            before = self._unindex(*_key(user_id, object_id))
+        if before is not None:
+            self._publish_changes(before, None)
+        return before
+
+    def records(self) -> list[dict]:
+        with self._lock:
+            return [dict(record) for user_records in self._by_user.values() for record in user_records.values()]
+
+    def user_records(self, user_id) -> list[dict]:
+        with self._lock:
+            return [dict(record) for record in self._by_user.get(str(user_id), {}).values()]
+
+    def records_by_state(self, state) -> list[dict]:
+        with self._lock:
+            return [dict(self._by_user[user_id][object_id]) for user_id, object_id in self._by_state.get(state, ())]
+
+    def user_ids(self) -> set:
+        with self._lock:
+            return {next(iter(user_records.values()))['user_id'] for user_records in self._by_user.values()}
+
+    def active_user_ids(self) -> set:
+        with self._lock:
+            return {self._by_user[user_id][object_id]['user_id'] for user_id, object_id in
+                    self._by_state.get(True, ())}
+
+    def try_lease(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            holder, expires_at = self._leases.get(name, (owner, 0.0))
+            if holder != owner and expires_at > now:
+                return False
+            self._leases[name] = (owner, now + ttl)
+            return True
+
+    def release_lease(self, name: str, owner: str):
+        with self._lock:
+            if self._leases.get(name, (None,))[0] == owner:
+                del self._leases[name]
+
+    def touch_presence(self, channel: str, member: str, ttl: float):
+        with self._lock:
+            self._presence.setdefault(channel, {})[member] = time.time() + ttl
+
+    def drop_presence(self, channel: str, member: str):
+        with self._lock:
+            members = self._presence.get(channel)
+            if members is not None:
+                members.pop(member, None)
+                if not members:
+                    del self._presence[channel]
+
+    def presence_counts(self) -> dict[str, int]:
+        now = time.time()
+        counts = {}
+        with self._lock:
+            for channel, members in list(self._presence.items()):
+                for member, expires_at in list(members.items()):
+                    if expires_at <= now:
+                        del members[member]
+                if members:
+                    counts[channel] = len(members)
+                else:
+                    del self._presence[channel]
+        return counts
+
+    def publish(self, user_id, event: dict) -> int:
+        with self._events_changed:
+            self._event_id += 1
+            self._events.append((self._event_id, str(user_id), event))
+            self._events_changed.notify_all()
+            return self._event_id
+
+    def events_since(self, after_id: int, user_id=None) -> list[tuple[int, dict]]:
+        user_id = str(user_id) if user_id is not None else None
+        with self._events_changed:
+            return [(event_id, event) for event_id, uid, event in self._events
+                    if event_id > after_id and (user_id is None or uid == user_id)]
+
+    def last_event_id(self) -> int:
+        with self._events_changed:
+            return self._event_id
+
+    def push_spare(self, pool: str, entry: dict):
+        with self._lock:
+            self._spares.setdefault(pool, deque()).append(dict(entry))
+
+    def claim_spare(self, pool: str) -> Optional[dict]:
+        with self._lock:
+            spares = self._spares.get(pool)
+            return spares.popleft() if spares else None
+
+    def spare_count(self, pool: str) -> int:
+        with self._lock:
+            return len(self._spares.get(pool, ()))
+
+    def incr_counter(self, name: str, amount: float = 1) -> float:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+            return self._counters[name]
+
+    def counters(self) -> dict[str, float]:
+        with self._lock:
+            return dict(self._counters)
+
+    def wait_for_events(self, after_id: int, user_id=None, timeout: float = 15.0,
+                        poll_interval: float = 0.5) -> list[tuple[int, dict]]:
+        # woken by publish() instead of polling
+        deadline = time.monotonic() + timeout
+        with self._events_changed:
+            while True:
+                events = self.events_since(after_id, user_id)
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events
+                self._events_changed.wait(remaining)
+
+
+class SQLiteRegistryBackend(RegistryBackend):
+    # WAL mode lets every gunicorn worker read while one writes, so all workers see the same streams
+    event_retention = 600
+
+    def __init__(self, path: str = default_registry_path, timeout: float = 5.0, poll_interval: float = 0.5):
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._events_changed = threading.Condition()
+        self._seen_event_id = 0
+        self._watcher_pid: Optional[int] = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._create_schema()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # one connection per thread, reopened after a fork so workers never share a file handle
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _create_schema(self):
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS streams (
+                user_id TEXT NOT NULL,
+                object_id TEXT NOT NULL,
+                active INTEGER NOT NULL DEFAULT 0,
+                data TEXT NOT NULL,
+                PRIMARY KEY (user_id, object_id)
+            );
+            CREATE INDEX IF NOT EXISTS ix_streams_active ON streams (active);
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_events_user_id ON events (user_id, id);
+            CREATE TABLE IF NOT EXISTS spares (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                pool TEXT NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_spares_pool ON spares (pool, id);
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS presence (
+                channel TEXT NOT NULL,
+                member TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (channel, member)
+            );
+            CREATE INDEX IF NOT EXISTS ix_presence_expires_at ON presence (expires_at);
+        ''')
+        columns = {name for (_, name, *_) in self.conn.execute('PRAGMA table_info(streams)')}
+        if 'state' not in columns:
+            # registries created before the state index keep working, the column is backfilled from the record
+            self.conn.execute('ALTER TABLE streams ADD COLUMN state TEXT')
+            rows = self.conn.execute('SELECT user_id, object_id, data FROM streams').fetchall()
+            self.conn.executemany('UPDATE streams SET state = ? WHERE user_id = ? AND object_id = ?',
+                                  [(json.dumps(json.loads(data)['stream_state']), user_id, object_id)
+                                   for user_id, object_id, data in rows])
+        self.conn.execute('CREATE INDEX IF NOT EXISTS ix_streams_state ON streams (state)')
+
+    def get(self, user_id, object_id) -> Optional[dict]:
+        row = self.conn.execute('SELECT data FROM streams WHERE user_id = ? AND object_id = ?',
+                                _key(user_id, object_id)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _transaction(self) -> sqlite3.Connection:
+        # the previous record, the write and its events must be seen together by other workers
+        conn = self.conn
+        conn.execute('BEGIN IMMEDIATE')
+        return conn
+
+    def _put(self, conn: sqlite3.Connection, record: dict) -> Optional[dict]:
+        user_id, object_id = _key(record['user_id'], record['object_id'])
+        row = conn.execute('SELECT data FROM streams WHERE user_id = ? AND object_id = ?',
+                           (user_id, object_id)).fetchone()
+        conn.execute('INSERT OR REPLACE INTO streams (user_id, object_id, active, state, data) '
+                     'VALUES (?, ?, ?, ?, ?)',
+                     (user_id, object_id, int(is_active(record)), json.dumps(record['stream_state']),
+                      json.dumps(record)))
+        before = json.loads(row[0]) if row else None
+        self._publish_changes(before, record)
+        return before
+
+    def put(self, record: dict) -> Optional[dict]:
+        conn = self._transaction()
+        try:
+            before = self._put(conn, record)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return before
+
+    def put_many(self, records: list[dict]):
+        # one transaction, and one fsync, for the whole batch
+        conn = self._transaction()
+        try:
+            for record in records:
+                self._put(conn, record)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def delete(self, user_id, object_id) -> Optional[dict]:
+        conn = self._transaction()
+        try:
+            row = conn.execute('SELECT data FROM streams WHERE user_id = ? AND object_id = ?',
+                               _key(user_id, object_id)).fetchone()
+            conn.execute('DELETE FROM streams WHERE user_id = ? AND object_id = ?', _key(user_id, object_id))
+            before = json.loads(row[0]) if row else None
+            if before is not None:
+                self._publish_changes(before, None)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return before
+
+    def records(self) -> list[dict]:
+        return [json.loads(data) for (data,) in self.conn.execute('SELECT data FROM streams')]
+
+    def user_records(self, user_id) -> list[dict]:
+        rows = self.conn.execute('SELECT data FROM streams WHERE user_id = ?', (str(user_id),))
+        return [json.loads(data) for (data,) in rows]
+
+    def records_by_state(self, state) -> list[dict]:
+        rows = self.conn.execute('SELECT data FROM streams WHERE state = ?', (json.dumps(state),))
+        return [json.loads(data) for (data,) in rows]
+
+    def user_ids(self) -> set:
+        return {json.loads(data)['user_id'] for (data,) in
+                self.conn.execute('SELECT data FROM streams GROUP BY user_id')}
+
+    def active_user_ids(self) -> set:
+        return {json.loads(data)['user_id'] for (data,) in
+                self.conn.execute('SELECT data FROM streams WHERE active = 1 GROUP BY user_id')}
+
+    def try_lease(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        cursor = self.conn.execute('INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) '
+                                   'ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, '
+                                   'expires_at = excluded.expires_at '
+                                   'WHERE leases.owner = excluded.owner OR leases.expires_at <= ?',
+                                   (name, owner, now + ttl, now))
+        return cursor.rowcount > 0
+
+    def release_lease(self, name: str, owner: str):
+        self.conn.execute('DELETE FROM leases WHERE name = ? AND owner = ?', (name, owner))
+
+    def touch_presence(self, channel: str, member: str, ttl: float):
+        self.conn.execute('INSERT OR REPLACE INTO presence (channel, member, expires_at) VALUES (?, ?, ?)',
+                          (channel, member, time.time() + ttl))
+
+    def drop_presence(self, channel: str, member: str):
+        self.conn.execute('DELETE FROM presence WHERE channel = ? AND member = ?', (channel, member))
+
+    def presence_counts(self) -> dict[str, int]:
+        now = time.time()
+        self.conn.execute('DELETE FROM presence WHERE expires_at <= ?', (now,))
+        return dict(self.conn.execute('SELECT channel, COUNT(*) FROM presence GROUP BY channel'))
+
+    def publish(self, user_id, event: dict) -> int:
+        now = time.time()
+        cursor = self.conn.execute('INSERT INTO events (user_id, created_at, data) VALUES (?, ?, ?)',
+                                   (str(user_id), now, json.dumps(event)))
+        if cursor.lastrowid % 100 == 0:
+            self.conn.execute('DELETE FROM events WHERE created_at < ?', (now - self.event_retention,))
+        return cursor.lastrowid
+
+    def events_since(self, after_id: int, user_id=None) -> list[tuple[int, dict]]:
+        if user_id is None:
+            rows = self.conn.execute('SELECT id, data FROM events WHERE id > ? ORDER BY id', (after_id,))
+        else:
+            rows = self.conn.execute('SELECT id, data FROM events WHERE user_id = ? AND id > ? ORDER BY id',
+                                     (str(user_id), after_id))
+        return [(event_id, json.loads(data)) for event_id, data in rows]
+
+    def last_event_id(self) -> int:
+        row = self.conn.execute('SELECT MAX(id) FROM events').fetchone()
+        return row[0] or 0
+
+    def push_spare(self, pool: str, entry: dict):
+        self.conn.execute('INSERT INTO spares (pool, data) VALUES (?, ?)', (pool, json.dumps(entry)))
+
+    def claim_spare(self, pool: str) -> Optional[dict]:
+        conn = self._transaction()
+        try:
+            row = conn.execute('SELECT id, data FROM spares WHERE pool = ? ORDER BY id LIMIT 1', (pool,)).fetchone()
+            if row:
+                conn.execute('DELETE FROM spares WHERE id = ?', (row[0],))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return json.loads(row[1]) if row else None
+
+    def spare_count(self, pool: str) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM spares WHERE pool = ?', (pool,)).fetchone()[0]
+
+    def incr_counter(self, name: str, amount: float = 1) -> float:
+        self.conn.execute('INSERT INTO counters (name, value) VALUES (?, ?) '
+                          'ON CONFLICT (name) DO UPDATE SET value = value + excluded.value', (name, amount))
+        return self.conn.execute('SELECT value FROM counters WHERE name = ?', (name,)).fetchone()[0]
+
+    def counters(self) -> dict[str, float]:
+        return dict(self.conn.execute('SELECT name, value FROM counters'))
+
+    def _watch_events(self):
+        # one poller per worker wakes the waiting event streams, an idle stream costs no sqlite query of its own
+        while True:
+            try:
+                last_event_id = self.last_event_id()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not poll the registry for events: {str(e)}")
+                last_event_id = self._seen_event_id
+            with self._events_changed:
+                if last_event_id != self._seen_event_id:
+                    self._seen_event_id = last_event_id
+                    self._events_changed.notify_all()
+            time.sleep(self.poll_interval)
+
+    def _ensure_watcher(self):
+        # threads do not survive a fork, so every worker starts its own poller on first use
+        if self._watcher_pid == os.getpid():
+            return
+        with self._events_changed:
+            if self._watcher_pid != os.getpid():
+                self._seen_event_id = self.last_event_id()
+                threading.Thread(target=self._watch_events, name='registry-events', daemon=True).start()
+                self._watcher_pid = os.getpid()
+
+    def wait_for_events(self, after_id: int, user_id=None, timeout: float = 15.0,
+                        poll_interval: float = None) -> list[tuple[int, dict]]:
+        self._ensure_watcher()
+        deadline = time.monotonic() + timeout
+        with self._events_changed:
+            seen = self._seen_event_id
+        while True:
+            events = self.events_since(after_id, user_id)
+            remaining = deadline - time.monotonic()
+            if events or remaining <= 0:
+                return events
+            with self._events_changed:
+                if self._seen_event_id == seen:
+                    self._events_changed.wait(remaining)
+                seen = self._seen_event_id
+
+
+class StreamRegistryQuery:
+    # read side of the registry for routes that only list streams, it never builds a facade, client or socket
+    internal_fields = ('user_id', 'initialized', 'last_active_at', 'registered_at', 'create_attempted', 'status_at')
+    # what anyone watching a streamer may see, the ingest credentials and server stay with the owner
+    viewer_fields = ('object_id', 'cam_angle', 'cam_label', 'hls', 'stream_state', 'status')
+
+    def __init__(self, registry: RegistryBackend = None):
+        self._registry = registry
+
+    @property
+    def registry(self) -> RegistryBackend:
+        return self._registry or get_registry()
+
+    @classmethod
+    def to_public(cls, record: dict) -> dict:
+        return {field: value for field, value in record.items() if field not in cls.internal_fields}
+
+    @classmethod
+    def to_viewer(cls, record: dict) -> dict:
+        return {field: record.get(field) for field in cls.viewer_fields}
+
+    def stream(self, user_id, object_id) -> Optional[dict]:
+        record = self.registry.get(user_id, object_id)
+        return self.to_public(record) if record is not None else None
+
+    def user_streams(self, user_id) -> list[dict]:
+        # in registration order, so the default angle comes first
+        records = sorted(self.registry.user_records(user_id), key=lambda record: record.get('registered_at', 0))
+        return [self.to_public(record) for record in records]
+
+    def viewer_streams(self, user_id) -> list[dict]:
+        records = sorted(self.registry.user_records(user_id), key=lambda record: record.get('registered_at', 0))
+        return [self.to_viewer(record) for record in records]
+
+    def user_ids(self) -> set:
+        return self.registry.user_ids()
+
+    def active_user_ids(self) -> set:
+        return self.registry.active_user_ids()
+
+    def last_event_id(self) -> int:
+        return self.registry.last_event_id()
+
+    def events_since(self, user_id, after_id: int) -> list[tuple[int, dict]]:
+        return self.registry.events_since(after_id, user_id=user_id)
+
+    def wait_for_events(self, user_id, after_id: int, timeout: float = 15.0) -> list[tuple[int, dict]]:
+        return self.registry.wait_for_events(after_id, user_id=user_id, timeout=timeout)
+
+
+_registry: Optional[RegistryBackend] = None
+_registry_lock = threading.Lock()
+
+
+def create_registry(backend: str = None, path: str = None) -> RegistryBackend:
+    backend = backend or os.environ.get('MULTICAM_REGISTRY_BACKEND', 'sqlite')
+    if backend == 'sqlite':
+        return SQLiteRegistryBackend(path or os.environ.get('MULTICAM_REGISTRY_PATH', default_registry_path))
+    if backend == 'local':
+        return LocalRegistryBackend()
+    raise ValueError(f"Unknown registry backend: {backend}")
+
+
+def get_registry() -> RegistryBackend:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = create_registry()
+                logger.info(f"Using {type(_registry).__name__} for the stream registry")
+    return _registry
+
+
+def set_registry(registry: RegistryBackend):
+    global _registry
+    _registry = registry
+
+
+stream_query = StreamRegistryQuery()
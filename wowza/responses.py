@@ -0,0 +1,69 @@
+import json
+from typing import Any, Optional, Union
+
+
+class KeyPath:
+    # a dotted key path split once at import time instead of on every lookup
+    __slots__ = ('path', 'keys')
+
+    def __init__(self, path: str):
+        self.path = path
+        self.keys = tuple(path.split('.'))
+
+    def get(self, data: Any) -> Any:
+        value = data
+        for key in self.keys:
+            if isinstance(value, dict) and key in value:
+                value = value[key]
+            else:
+                return None
+        return value
+
+
+key_path_state = KeyPath('live_stream.state')
+key_path_id = KeyPath('live_stream.id')
+# source connection
+key_path_primary_server = KeyPath('live_stream.source_connection_information.primary_server')
+key_path_stream_name = KeyPath('live_stream.source_connection_information.stream_name')
+key_path_username = KeyPath('live_stream.source_connection_information.username')
+key_path_password = KeyPath('live_stream.source_connection_information.password')
+# end connection
+key_path_embed_code = KeyPath('live_stream.embed_code')
+key_path_hls = KeyPath('live_stream.hls_playback_url')
+key_path_created_at = KeyPath('live_stream.created_at')
+key_path_live_streams = KeyPath('live_streams')
+
+
+class LiveStreamResponse:
+    # a wowza live_stream payload, decoded once and reduced to the fields the app reads
+    __slots__ = ('id', 'state', 'primary_server', 'stream_name', 'username', 'password', 'embed_code', 'hls',
+                 'created_at')
+
+    def __init__(self, data: dict):
+        self.id: Optional[str] = key_path_id.get(data)
+        self.state: Optional[str] = key_path_state.get(data)
+        self.primary_server: Optional[str] = key_path_primary_server.get(data)
+        self.stream_name: Optional[str] = key_path_stream_name.get(data)
+        self.username: Optional[str] = key_path_username.get(data)
+        self.password: Optional[str] = key_path_password.get(data)
+        self.embed_code: Optional[str] = key_path_embed_code.get(data)
+        self.hls: Optional[str] = key_path_hls.get(data)
+        self.created_at: Optional[str] = key_path_created_at.get(data)
+
+    @classmethod
+    def from_body(cls, body: Union[str, bytes]) -> 'LiveStreamResponse':
+        return cls(json.loads(body))
+
+
+class LiveStreamListResponse:
+    # one page of GET /live_streams, reduced to (id, name) pairs
+    __slots__ = ('streams',)
+
+    def __init__(self, data: dict):
+        self.streams: list[tuple[Optional[str], Optional[str]]] = [
+            (stream.get('id'), stream.get('name')) for stream in key_path_live_streams.get(data) or []
+            if isinstance(stream, dict)]
+
+    @classmethod
+    def from_body(cls, body: Union[str, bytes]) -> 'LiveStreamListResponse':
+        return cls(json.loads(body))
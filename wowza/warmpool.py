@@ -0,0 +1,91 @@
+import logging
+import os
+from typing import Optional
+
+from wowza.background import LeasedLoop
+from wowza.capacity import transcoder_capacity
+from wowza.registry import RegistryBackend
+from wowza.wowzaclient import WowzaClient, warm_pool_name, warm_pool_size
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class WarmStreamPool(LeasedLoop):
+    # keeps a few created and initialized wowza streams in the registry so setup() can skip the slow part
+    lease_name = 'warm-stream-pool'
+    thread_name = 'wowza-warm-pool'
+    job_name = 'Warm pool replenishment'
+    # creating a spare waits for wowza to initialize it
+    lease_grace = 60.0
+
+    def __init__(self, target_size: int = None, interval: float = None, registry: RegistryBackend = None):
+        super().__init__(interval if interval is not None else float(os.environ.get('MULTICAM_WARM_POOL_INTERVAL', 10)),
+                         registry)
+        self.target_size = target_size if target_size is not None else warm_pool_size
+
+    @staticmethod
+    def create_spare() -> Optional[dict]:
+        client = WowzaClient()
+        created = client.create_live_stream()
+        embed_code = client.wait_until_initialized(stream_id=created.stream_id)
+        if embed_code is None:
+            logger.error(f"Warm pool stream {created.stream_id} never finished initializing")
+            return None
+        return {
+            'stream_id': created.stream_id,
+            'stream_name': created.stream_name,
+            'state': created.state,
+            'username': created.username,
+            'password': created.password,
+            'embed_code': embed_code,
+            'hls': created.hls,
+            'primary_server': created.primary_server,
+        }
+
+    def replenish(self) -> int:
+        added = 0
+        missing = self.target_size - self.registry.spare_count(warm_pool_name)
+        available = transcoder_capacity.available()
+        if available is not None:
+            # spares count against the global transcoder limit like any other stream
+            missing = min(missing, available)
+        for _ in range(missing):
+            try:
+                spare = self.create_spare()
+            except Exception as e:
+                logger.error(f"Could not pre-create a warm pool stream: {str(e)}")
+                break
+            if spare is None:
+                break
+            self.registry.push_spare(warm_pool_name, spare)
+            added += 1
+        if added:
+            logger.info(f"Added {added} streams to the warm pool")
+        return added
+
+    def metrics(self) -> dict:
+        counters = self.registry.counters()
+        hits = counters.get('warm_pool.hits', 0)
+        misses = counters.get('warm_pool.misses', 0)
+        metrics = {
+            'size': self.registry.spare_count(warm_pool_name),
+            'target_size': self.target_size,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else None,
+        }
+        for source in ('warm', 'cold'):
+            count = counters.get(f'time_to_ready.{source}.count', 0)
+            seconds = counters.get(f'time_to_ready.{source}.seconds', 0)
+            metrics[f'avg_time_to_ready_{source}'] = seconds / count if count else None
+        return metrics
+
+    def should_run(self) -> bool:
+        return self.target_size > 0 and super().should_run()
+
+    def run_once(self):
+        self.replenish()
+
+
+warm_stream_pool = WarmStreamPool()
@@ -1,9 +1,28 @@
-from flask import Blueprint,request, jsonify
-from wowza.wowzaclient import WowzaFacade, logger
+import os
+from flask import Blueprint, request, jsonify
+from resilience import CircuitOpenError
+from wowza.wowzaclient import WowzaAPIException, WowzaFacade, logger, wowza_breaker
+from wowza.provisioning import provisioning_queue
+from wowza.registry import is_active, stream_query
+from wowza.warmpool import warm_stream_pool
+from wowza.capacity import transcoder_capacity
+from wowza.profiles import encoding_profiles
+from wowza.regions import broadcast_locations
 from flask_login import current_user, login_required
 from uuid import uuid4
 
 wowza = Blueprint("wowza", __name__)
+max_batch_cameras = int(os.environ.get('MULTICAM_MAX_BATCH_CAMERAS', 10))
+
+
+def wowza_failure(error: str, circuit_open: bool, data=None):
+    # an open circuit is temporary, the client may retry once the breaker lets a trial call through to wowza
+    body = {'status': 'failed', 'error': error}
+    if data is not None:
+        body['data'] = data
+    if circuit_open:
+        return jsonify(body), 503, {'Retry-After': str(int(wowza_breaker.reset_timeout))}
+    return jsonify(body), 502
 
 
 @wowza.post('/api/v1/initialize_stream')
@@ -12,7 +31,7 @@ def initialize_stream():
     """
        Initialize a stream with specific camera settings.
        ---
-       description: This endpoint initializes a stream for the user, requiring camera angle (`camAngle`) and label (`camLabel`) as parameters. It generates a unique object ID and sets up the stream.
+       description: This endpoint queues the setup of a stream for the user, requiring camera angle (`camAngle`) and label (`camLabel`) as parameters. It generates a unique object ID, which is also the provisioning job id, and returns immediately. Poll `/api/v1/stream_status` with the job id for progress.
        requestBody:
          required: true
          content:
@@ -28,9 +47,26 @@ def initialize_stream():
                    type: string
                    description: The label or name for the camera.
                    example: "Front Camera"
+                 objectId:
+                   type: string
+                   description: Optional client-generated id. Repeating a request with the same id joins the setup already in progress instead of creating a second stream.
+                   example: "3f0c2a8e-5b1d-4c55-9a0e-1d2f3a4b5c6d"
+                 encodingProfile:
+                   type: string
+                   enum: [transcoded, preview, passthrough]
+                   description: Optional encoding profile of the camera. `transcoded` builds a full bitrate ladder, `preview` a cheap low resolution one and `passthrough` relays the camera's own encoding for the lowest latency. Defaults to `MULTICAM_DEFAULT_ENCODING_PROFILE`.
+                   example: "passthrough"
+                 broadcastLocation:
+                   type: string
+                   description: Optional wowza broadcast location to ingest in, overrides the measured round trip times.
+                   example: "eu_germany"
+                 regionRtts:
+                   type: object
+                   description: Optional round trip times in milliseconds from the streamer to each region's probe url. The stream is created in the fastest region, or in `MULTICAM_DEFAULT_BROADCAST_LOCATION` without measurements.
+                   example: {"us_west_oregon": 142, "eu_germany": 21}
        responses:
-         200:
-           description: Stream successfully initialized.
+         202:
+           description: Stream setup queued.
            content:
              application/json:
                schema:
@@ -38,10 +74,10 @@ def initialize_stream():
                  properties:
                    data:
                      type: object
-                     description: The setup information of the stream.
-                     example: {"streamId": "abc123", "status": "success"}
+                     description: The provisioning job of the stream.
+                     example: {"job_id": "abc123", "object_id": "abc123", "status": "pending"}
          400:
-           description: Missing required parameters (`camAngle` or `camLabel`).
+           description: Missing required parameters (`camAngle` or `camLabel`), or an unknown `encodingProfile` or `broadcastLocation`.
            content:
              application/json:
                schema:
@@ -71,7 +107,10 @@ def initialize_stream():
        """
     data = request.get_json()
     user_id = current_user.id
-    object_id = str(uuid4())
+    object_id = str(data.get('objectId') or uuid4())
+
+    if len(object_id) > 64:
+        return jsonify({'status': 'failed', 'error': 'objectId must be at most 64 characters'}), 400
 
     cam_angle = data.get('camAngle')
     cam_label = data.get('camLabel')
@@ -79,15 +118,170 @@ def initialize_stream():
     if not cam_angle or not cam_label:
         return jsonify({'status': 'failed', 'error': 'Missing required parameters: camAngle, camLabel'}), 400
 
-    wowza_service = WowzaFacade(user_id=user_id, object_id=object_id, cam_angle=cam_angle, cam_label=cam_label)
+    encoding_profile = data.get('encodingProfile')
+    if encoding_profile is not None and encoding_profile not in encoding_profiles:
+        return jsonify({'status': 'failed', 'error': f'Unknown encodingProfile: {encoding_profile}'}), 400
+    broadcast_location = data.get('broadcastLocation')
+    if broadcast_location is not None and broadcast_location not in broadcast_locations:
+        return jsonify({'status': 'failed', 'error': f'Unknown broadcastLocation: {broadcast_location}'}), 400
+
     try:
-        setup_info = wowza_service.setup()
-        return jsonify({'data':setup_info}),200
+        provisioning_queue.submit(user_id=user_id, object_id=object_id, cam_angle=cam_angle, cam_label=cam_label,
+                                  encoding_profile=encoding_profile, region_hint=broadcast_location,
+                                  region_rtts=data.get('regionRtts'))
+        return jsonify({'data':{'job_id':object_id,'object_id':object_id,'status':'pending'}}),202
     except Exception as e:
         logger.error(f"Error initializing stream for user {user_id}: {str(e)}")
         return jsonify({'status':'failed','error':str(e)}),500
 
 
+@wowza.post('/api/v1/initialize_streams')
+@login_required
+def initialize_streams():
+    """
+       Initialize several cameras at once.
+       ---
+       description: This endpoint queues one stream setup per camera and returns at once with a job id per camera, in the order of `cameras`. The cameras are provisioned concurrently, with bounded parallelism; poll `/api/v1/stream_status` with each job id for its progress.
+       requestBody:
+         required: true
+         content:
+           application/json:
+             schema:
+               type: object
+               properties:
+                 cameras:
+                   type: array
+                   items:
+                     type: object
+                     properties:
+                       camAngle:
+                         type: string
+                         example: "Wide Shot (WS)"
+                       camLabel:
+                         type: string
+                         example: "Front Camera"
+                       encodingProfile:
+                         type: string
+                         enum: [transcoded, preview, passthrough]
+                         example: "preview"
+                 broadcastLocation:
+                   type: string
+                   description: Optional wowza broadcast location for every camera of the batch.
+                   example: "eu_germany"
+                 regionRtts:
+                   type: object
+                   description: Optional round trip times in milliseconds from the streamer to each region's probe url.
+                   example: {"us_west_oregon": 142, "eu_germany": 21}
+       responses:
+         202:
+           description: The setups were queued, one job per camera.
+           content:
+             application/json:
+               schema:
+                 type: object
+                 properties:
+                   data:
+                     type: object
+                     example: {"jobs": [{"job_id": "abc123", "object_id": "abc123", "status": "pending"}]}
+         400:
+           description: Missing cameras, a camera that is not an object or has no `camAngle` or `camLabel`, an unknown `encodingProfile` or `broadcastLocation`, or too many cameras.
+           content:
+             application/json:
+               schema:
+                 type: object
+                 properties:
+                   status:
+                     type: string
+                     example: "failed"
+                   error:
+                     type: string
+                     example: "Missing required parameters: camAngle, camLabel"
+       security:
+         - oauth2: []  # Assumes OAuth2 is being used for authentication
+       """
+    data = request.get_json()
+    user_id = current_user.id
+    cameras = data.get('cameras') if isinstance(data, dict) else None
+
+    if not cameras or not isinstance(cameras, list):
+        return jsonify({'status': 'failed', 'error': 'Missing required parameter: cameras'}), 400
+    if len(cameras) > max_batch_cameras:
+        return jsonify({'status': 'failed', 'error': f'At most {max_batch_cameras} cameras per batch'}), 400
+    if not all(isinstance(camera, dict) for camera in cameras):
+        return jsonify({'status': 'failed', 'error': 'Every camera must be an object'}), 400
+    if not all(camera.get('camAngle') and camera.get('camLabel') for camera in cameras):
+        return jsonify({'status': 'failed', 'error': 'Missing required parameters: camAngle, camLabel'}), 400
+    unknown_profiles = {camera['encodingProfile'] for camera in cameras
+                        if camera.get('encodingProfile') is not None} - encoding_profiles.keys()
+    if unknown_profiles:
+        return jsonify({'status': 'failed', 'error': f'Unknown encodingProfile: {", ".join(sorted(unknown_profiles))}'}), 400
+    broadcast_location = data.get('broadcastLocation')
+    if broadcast_location is not None and broadcast_location not in broadcast_locations:
+        return jsonify({'status': 'failed', 'error': f'Unknown broadcastLocation: {broadcast_location}'}), 400
+
+    # the cameras of one batch share the streamer's encoder location
+    batch = [{'object_id': str(uuid4()), 'cam_angle': camera['camAngle'], 'cam_label': camera['camLabel'],
+              'encoding_profile': camera.get('encodingProfile'), 'region_hint': broadcast_location,
+              'region_rtts': data.get('regionRtts')}
+             for camera in cameras]
+    try:
+        provisioning_queue.submit_batch(user_id, batch)
+    except Exception as e:
+        logger.error(f"Error initializing streams for user {user_id}: {str(e)}")
+        return jsonify({'status': 'failed', 'error': str(e)}), 500
+    return jsonify({'data': {'jobs': [{'job_id': camera['object_id'], 'object_id': camera['object_id'],
+                                       'status': 'pending'} for camera in batch]}}), 202
+
+
+@wowza.get('/api/v1/stream_status')
+@login_required
+def stream_status():
+    """
+       Get the provisioning status of a stream.
+       ---
+       description: This endpoint reports the progress of a stream setup job started by `/api/v1/initialize_stream`. Once the status is `ready` the response carries the embed code, HLS URL and ingest credentials.
+       parameters:
+         - name: objectId
+           in: query
+           description: The job id returned by `/api/v1/initialize_stream`.
+           required: true
+           schema:
+             type: string
+       responses:
+         200:
+           description: The current state of the provisioning job.
+           content:
+             application/json:
+               schema:
+                 type: object
+                 properties:
+                   data:
+                     type: object
+                     description: The stream record, `status` is one of pending, creating, initializing, ready or failed.
+                     example: {"object_id": "abc123", "status": "ready", "hls": "https://.../playlist.m3u8"}
+         404:
+           description: No stream with this id exists for the user.
+           content:
+             application/json:
+               schema:
+                 type: object
+                 properties:
+                   status:
+                     type: string
+                     example: "failed"
+                   error:
+                     type: string
+                     example: "Unknown objectId"
+       security:
+         - oauth2: []  # Assumes OAuth2 is being used for authentication
+       """
+    object_id = request.args.get('objectId')
+    stream = stream_query.stream(current_user.id, object_id)
+    if stream is None:
+        return jsonify({'status': 'failed', 'error': 'Unknown objectId'}), 404
+    return jsonify({'data': stream}), 200
+
+
 
 @wowza.put('/api/v1/listen_to_stream')
 def listen_to_stream():
@@ -131,8 +325,8 @@ def listen_to_stream():
                     error:
                       type: string
                       example: "Missing objectId"
-          500:
-            description: Server error while trying to start stream listening.
+          502:
+            description: Wowza failed to start the stream.
             content:
               application/json:
                 schema:
@@ -143,7 +337,9 @@ def listen_to_stream():
                       example: "failed"
                     error:
                       type: string
-                      example: "Error starting to listen to stream"
+                      example: "Could not start stream abc123: PUT /api/v2.0/live_streams/xyz/start returned 500"
+          503:
+            description: Wowza is failing fast after repeated errors, retry after the `Retry-After` header.
         security:
           - oauth2: []  # Assumes OAuth2 is being used for authentication
         """
@@ -151,10 +347,76 @@ def listen_to_stream():
     user_id = current_user.id
     object_id = data.get('objectId')
     wowza_service = WowzaFacade(user_id, object_id)
-    listen_data = wowza_service.listen_to_stream()
+    try:
+        listen_data = wowza_service.listen_to_stream()
+    except (CircuitOpenError, WowzaAPIException) as e:
+        logger.error(f"Could not start stream {object_id}: {str(e)}")
+        return wowza_failure(f"Could not start stream {object_id}: {str(e)}", isinstance(e, CircuitOpenError))
     return jsonify({'data':listen_data}), 200
 
 
+@wowza.put('/api/v1/listen_to_streams')
+@login_required
+def listen_to_streams():
+    """
+        Start every camera of the current user at once.
+        ---
+        description: This endpoint starts all of the user's initialized streams that are not running yet, concurrently, and reports the result of each one. Streams that could not be started are listed in `failed`; with nothing to start the status is success and `results` is empty.
+        responses:
+          200:
+            description: The aggregated result, `status` is success, partial or failed.
+            content:
+              application/json:
+                schema:
+                  type: object
+                  properties:
+                    data:
+                      type: object
+                      example: {"status": "partial", "results": {"abc123": {"state": true}, "def456": null}, "failed": ["def456"]}
+          502:
+            description: No stream could be started, the aggregated result is in `data`.
+          503:
+            description: Wowza is failing fast after repeated errors, retry after the `Retry-After` header.
+        security:
+          - oauth2: []  # Assumes OAuth2 is being used for authentication
+        """
+    listen_data = WowzaFacade.start_all(current_user.id)
+    if listen_data['status'] == 'failed':
+        return wowza_failure('Could not start any stream', wowza_breaker.state == 'open', listen_data)
+    return jsonify({'data': listen_data}), 200
+
+
+@wowza.post('/api/v1/stop_streams')
+@login_required
+def stop_streams():
+    """
+        Stop every camera of the current user at once.
+        ---
+        description: This endpoint stops all of the user's running streams concurrently and reports the result of each one; with nothing to stop the status is success and `results` is empty. Unlike `/api/v1/stop_stream` the instances are kept so the cameras can be started again.
+        responses:
+          200:
+            description: The aggregated result, `status` is success, partial or failed.
+            content:
+              application/json:
+                schema:
+                  type: object
+                  properties:
+                    data:
+                      type: object
+                      example: {"status": "success", "results": {"abc123": {"state": false}}, "failed": []}
+          502:
+            description: No stream could be stopped, the aggregated result is in `data`.
+          503:
+            description: Wowza is failing fast after repeated errors, retry after the `Retry-After` header.
+        security:
+          - oauth2: []  # Assumes OAuth2 is being used for authentication
+        """
+    stop_data = WowzaFacade.stop_all(current_user.id)
+    if stop_data['status'] == 'failed':
+        return wowza_failure('Could not stop any stream', wowza_breaker.state == 'open', stop_data)
+    return jsonify({'data': stop_data}), 200
+
+
 @wowza.post('/api/v1/stop_stream')
 def stop_stream():
     """
@@ -197,8 +459,8 @@ def stop_stream():
                    error:
                      type: string
                      example: "Missing objectId"
-         500:
-           description: Server error while trying to stop the stream or delete the instance.
+         502:
+           description: Wowza failed to stop the stream, the instance is kept.
            content:
              application/json:
                schema:
@@ -209,7 +471,9 @@ def stop_stream():
                      example: "failed"
                    error:
                      type: string
-                     example: "Error stopping the stream or deleting the instance"
+                     example: "Could not stop stream abc123: PUT /api/v2.0/live_streams/xyz/stop returned 500"
+         503:
+           description: Wowza is failing fast after repeated errors, retry after the `Retry-After` header.
        security:
          - oauth2: []  # Assumes OAuth2 is being used for authentication
        """
@@ -217,7 +481,14 @@ def stop_stream():
     user_id = current_user.id
     object_id = data.get('objectId')
     wowza_service = WowzaFacade(user_id, object_id)
-    stop_data = wowza_service.stop_stream()
+    stop_data = None
+    if is_active(wowza_service.to_record()):
+        # a stream wowza would not stop keeps its instance, so it can still be stopped and is not left running
+        try:
+            stop_data = wowza_service.stop_stream()
+        except (CircuitOpenError, WowzaAPIException) as e:
+            logger.error(f"Could not stop stream {object_id}: {str(e)}")
+            return wowza_failure(f"Could not stop stream {object_id}: {str(e)}", isinstance(e, CircuitOpenError))
     delete_instance_data = wowza_service.delete_instance(user_id, object_id)
     logger.info(delete_instance_data)
     return jsonify({'data':stop_data}), 200
@@ -286,4 +557,52 @@ def delete_instance():
     object_id = data.get('objectId')
     wowza_service = WowzaFacade(user_id, object_id)
     delete_instance_data = wowza_service.delete_instance(user_id, object_id)
-    return jsonify({'data':delete_instance_data}), 200
\ No newline at end of file
+    return jsonify({'data':delete_instance_data}), 200
+
+
+@wowza.get('/api/v1/metrics/warm_pool')
+@login_required
+def warm_pool_metrics():
+    """
+        Get the metrics of the pre-warmed live stream pool.
+        ---
+        description: This endpoint reports how many pre-created streams are waiting, how often setups were served from the pool and the average time until a stream was ready, for warm and cold setups. Counters are shared by all workers.
+        responses:
+          200:
+            description: The warm pool metrics.
+            content:
+              application/json:
+                schema:
+                  type: object
+                  properties:
+                    data:
+                      type: object
+                      example: {"size": 2, "target_size": 3, "hits": 10, "misses": 2, "hit_rate": 0.83, "avg_time_to_ready_warm": 0.01, "avg_time_to_ready_cold": 14.2}
+        security:
+          - oauth2: []  # Assumes OAuth2 is being used for authentication
+        """
+    return jsonify({'data': warm_stream_pool.metrics()}), 200
+
+
+@wowza.get('/api/v1/metrics/capacity')
+@login_required
+def capacity_metrics():
+    """
+        Get the transcoder capacity and the provisioning queue.
+        ---
+        description: This endpoint reports how many wowza transcoders are in use against the global (`MULTICAM_MAX_TRANSCODERS`) and per-user (`MULTICAM_MAX_USER_TRANSCODERS`) limits, which users are at their limit, how many setups are waiting in this worker's queue and how many gave up waiting. A limit of 0 means unlimited.
+        responses:
+          200:
+            description: The capacity metrics.
+            content:
+              application/json:
+                schema:
+                  type: object
+                  properties:
+                    data:
+                      type: object
+                      example: {"in_use": 18, "max_transcoders": 20, "max_user_transcoders": 4, "users_at_limit": ["7"], "admission_timeouts": 1, "queued": 3}
+        security:
+          - oauth2: []  # Assumes OAuth2 is being used for authentication
+        """
+    return jsonify({'data': {**transcoder_capacity.metrics(), 'queued': provisioning_queue.queued()}}), 200
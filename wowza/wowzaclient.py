@@ -1,11 +1,21 @@
-import http.client
 from abc import ABC, abstractmethod
 import json
 import os
 from dotenv import load_dotenv
 from typing import Optional
+import hashlib
+import http.client
 import logging
-from time import sleep
+import threading
+from time import sleep, monotonic, time
+from concurrent.futures import ThreadPoolExecutor
+from wowza.registry import get_registry, is_active
+from httppool import PoolTimeout, get_pool
+from resilience import CircuitBreaker, backoff_delays, retry_after
+from wowza.profiles import default_encoding_profile, encoding_profiles
+from wowza.regions import default_broadcast_location, region_selector
+from wowza.responses import LiveStreamListResponse, LiveStreamResponse
+from wowza.singleflight import SingleFlight
 
 
 
@@ -14,42 +24,49 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 wowza_access_token = os.environ.get('WOWZA_STREAMING_CLOUD_TOKEN')
+# number of pre-created live streams to keep ready for setup(), 0 turns the warm pool off
+warm_pool_size = int(os.environ.get('MULTICAM_WARM_POOL_SIZE', 0))
+warm_pool_name = 'default'
+bulk_concurrency = int(os.environ.get('MULTICAM_BULK_CONCURRENCY', 8))
+# how long a worker may hold the cross-worker setup lease of a stream before another worker may take over
+setup_lease_ttl = float(os.environ.get('MULTICAM_SETUP_LEASE_TTL', 120))
+# attempts of an idempotent wowza call, and the longest single wait between them
+wowza_max_attempts = int(os.environ.get('MULTICAM_WOWZA_MAX_ATTEMPTS', 3))
+wowza_max_backoff = float(os.environ.get('MULTICAM_WOWZA_MAX_BACKOFF', 10))
+# how long a new stream may stay in_progress before setup gives up on it
+wowza_ready_timeout = float(os.environ.get('MULTICAM_WOWZA_READY_TIMEOUT', 60))
+# one breaker per worker, every client of the worker fails fast while wowza is degraded
+wowza_breaker = CircuitBreaker('wowza', failure_threshold=int(os.environ.get('MULTICAM_WOWZA_BREAKER_FAILURES', 5)),
+                               reset_timeout=float(os.environ.get('MULTICAM_WOWZA_BREAKER_RESET', 30)))
+# pages of the live stream list searched for an idempotency key before a stream is created again
+wowza_lookup_pages = int(os.environ.get('MULTICAM_WOWZA_LOOKUP_PAGES', 10))
+# network errors after which the request may or may not have reached wowza
+transport_errors = (OSError, http.client.HTTPException, PoolTimeout)
 
-key_path_state = 'live_stream.state'
-key_path_id = 'live_stream.id'
-# source connection
-key_path_primary_server = 'live_stream.source_connection_information.primary_server'
-key_path_stream_name = 'live_stream.source_connection_information.stream_name'
-key_path_username = 'live_stream.source_connection_information.username'
-key_path_password = 'live_stream.source_connection_information.password'
-# end connection
-key_path_embed_code = 'live_stream.embed_code'
-key_path_hls ='live_stream.hls_playback_url'
-key_path_created_at = 'live_stream.created_at'
 
+def idempotency_key(user_id, object_id) -> str:
+    # stable per camera of a user, so every attempt to create its stream carries the same key while two streamers
+    # that pick the same objectId never find each other's stream
+    return hashlib.sha256(f'{user_id}:{object_id}'.encode()).hexdigest()[:24]
 
 
+def live_stream_name(key: str) -> str:
+    return f'multicam-{key}'
 
 
-def get_nested_value(data: json, key_path):
-    keys = key_path.split('.')
-    value = json.loads(data)
-    for key in keys:
-        print('hit', key)
-        if isinstance(value, dict) and key in value:
-            value = value[key]
-        else:
-            return None
-    return value
+def setup_lease_name(user_id, object_id) -> str:
+    return f'setup:{user_id}:{object_id}'
 
 
 class WowzaAPIException(Exception):
-    ...
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
 
 
 class WowzaClientBase(ABC):
     @abstractmethod
-    def create_live_stream(self):
+    def create_live_stream(self, lookup_first=False):
         ...
 
     @abstractmethod
@@ -68,6 +85,10 @@ class WowzaClientBase(ABC):
     def stop_listening_to_stream(self, stream_id):
         ...
 
+    @abstractmethod
+    def delete_live_stream(self, stream_id):
+        ...
+
 
 class WowzaClientConfig:
     def __init__(self):
@@ -88,6 +109,12 @@ class WowzaClientConfig:
 
         self.cam_angle:Optional[str] = None
         self.cam_label:Optional[str] = None
+        self.encoding_profile: str = default_encoding_profile
+        self.broadcast_location: str = default_broadcast_location
+        # set for streams that belong to a camera, names the wowza stream so a retry can find it
+        self.idempotency_key: Optional[str] = None
+        # a create request went out for this camera, it may have reached wowza even if we never saw the response
+        self.create_attempted: bool = False
 
     @property
     def payload(self) -> json:
@@ -121,12 +148,14 @@ class WowzaClientConfig:
     def api(self, value):
         self._api = value
 
-    def construct(self, name_of_stream='My streaming'):
+    def construct(self, name_of_stream=None):
         self.base_api = 'api.video.wowza.com'
+        if name_of_stream is None:
+            name_of_stream = live_stream_name(self.idempotency_key) if self.idempotency_key else 'My streaming'
         payload = {
-            "live_stream": {"aspect_ratio_height": 720, "aspect_ratio_width": 1280, "billing_mode": "pay_as_you_go",
-                            "broadcast_location": "us_west_oregon", "encoder": "other_rtmp", "name": name_of_stream,
-                            "transcoder_type": "transcoded"}}
+            "live_stream": {"billing_mode": "pay_as_you_go", "broadcast_location": self.broadcast_location,
+                            "encoder": "other_rtmp", "name": name_of_stream,
+                            **encoding_profiles[self.encoding_profile]}}
         self.payload = json.dumps(payload)
         self.header = {"Authorization": f"Bearer {wowza_access_token}", "Content-Type": "application/json"}
 
@@ -137,67 +166,165 @@ class WowzaClient(WowzaClientBase):
             data = WowzaClientConfig()
         self.data = data
         self.data.construct()
-        self.conn = http.client.HTTPSConnection(self.data.base_api)
-
-    def create_live_stream(self):
-        self.data.api = '/api/v2.0/live_streams'
-        self.conn.request("POST", self.data.api, body=self.data.payload, headers=self.data.header)
-        data = self.url_construct()
+        # connections are shared per host across every client of the worker, building a client opens no socket
+        self.pool = get_pool(self.data.base_api)
+
+    def create_live_stream(self, lookup_first=False):
+        # with an idempotency key a create that may have gone through is looked up before it is sent again
+        key = self.data.idempotency_key
+        delays = backoff_delays(maximum=wowza_max_backoff)
+        for attempt in range(1, wowza_max_attempts + 1):
+            existing_id = self.find_live_stream(key) if key and (lookup_first or attempt > 1) else None
+            if existing_id is not None:
+                logger.info(f"Reusing live stream {existing_id} created by an earlier attempt for key {key}")
+                self.data.api = f'/api/v2.0/live_streams/{existing_id}'
+                self.data.payload = ''
+                data = self.url_construct("GET")
+                break
+            self.data.api = '/api/v2.0/live_streams'
+            # the other calls clear the payload, and the encoding profile may have been picked after __init__
+            self.data.construct()
+            try:
+                data = self.url_construct("POST")
+                break
+            except WowzaAPIException as e:
+                # a 4xx is wowza rejecting the request, after anything else the stream may exist
+                rejected = e.status is not None and 400 <= e.status < 500
+                if not key or rejected or attempt == wowza_max_attempts:
+                    raise
+                delay = next(delays)
+                logger.warning(f"Creating live stream {key} failed ({str(e)}), looking it up in {delay:.1f}s")
+                sleep(delay)
         # data = mock_data()
-        self.data.stream_id = get_nested_value(data, key_path_id)
-        self.data.state = get_nested_value(data, key_path_state)
-        self.data.stream_name = get_nested_value(data, key_path_stream_name)
-        self.data.username = get_nested_value(data, key_path_username)
-        self.data.password = get_nested_value(data, key_path_password)
+        self.data.stream_id = data.id
+        self.data.state = data.state
+        self.data.stream_name = data.stream_name
+        self.data.username = data.username
+        self.data.password = data.password
         return self.data
 
+    def find_live_stream(self, key: str) -> Optional[str]:
+        name = live_stream_name(key)
+        for page in range(1, wowza_lookup_pages + 1):
+            self.data.api = f'/api/v2.0/live_streams?page={page}&per_page=1000'
+            self.data.payload = ''
+            streams = self.url_construct("GET", LiveStreamListResponse).streams
+            for stream_id, stream_name in streams:
+                if stream_name == name:
+                    return stream_id
+            if len(streams) < 1000:
+                return None
+        return None
+
     # This ensures the embed code attribute is set after the creation of the stream instead of showing processing.
     def initialize_live_stream(self, stream_id):
         self.data.api = f'/api/v2.0/live_streams/{stream_id}'
         self.data.payload = ''
-        self.conn.request("GET", self.data.api, self.data.payload, self.data.header)
-        data = self.url_construct()
+        data = self.url_construct("GET")
         # data = mock_data()
-        self.data.embed_code = get_nested_value(data, key_path_embed_code)
-        self.data.hls = get_nested_value(data,key_path_hls)
-        self.data.primary_server = get_nested_value(data,key_path_primary_server)
+        self.data.embed_code = data.embed_code
+        self.data.hls = data.hls
+        self.data.primary_server = data.primary_server
         return self.data
 
+    def wait_until_initialized(self, stream_id, timeout=None) -> Optional[str]:
+        # takes a while to get initialized in the wowza server, None when it never leaves in_progress
+        deadline = monotonic() + (timeout if timeout is not None else wowza_ready_timeout)
+        delays = backoff_delays(base=1.0, factor=1.5, maximum=8.0)
+        embed_code = self.initialize_live_stream(stream_id=stream_id).embed_code
+        while embed_code == 'in_progress':
+            delay = next(delays)
+            if monotonic() + delay >= deadline:
+                return None
+            sleep(delay)
+            logger.debug('Waiting for stream to initialize...')
+            embed_code = self.initialize_live_stream(stream_id=stream_id).embed_code
+        return embed_code
+
     def start_listening_to_stream(self, stream_id):
         self.data.api = f'/api/v2.0/live_streams/{stream_id}/start'
         self.data.payload = ''
-        self.conn.request("PUT", self.data.api, self.data.payload, self.data.header)
-        data = self.url_construct()
+        data = self.url_construct("PUT")
         # data = mock_data1()
-        self.data.stream_state = get_nested_value(data, key_path_state)
+        self.data.stream_state = data.state
         return self.data
 
     def get_state_of_stream(self, stream_id):
         self.data.api = f'/api/v2.0/live_streams/{stream_id}/state'
         self.data.payload = ''
-        self.conn.request("GET", self.data.api, self.data.payload, self.data.header)
-        data = self.url_construct()
-        self.data.state = get_nested_value(data, key_path_state)
+        data = self.url_construct("GET")
+        self.data.state = data.state
         return self.data
 
     def stop_listening_to_stream(self, stream_id):
         self.data.api = f'/api/v2.0/live_streams/{stream_id}/stop'
         self.data.payload = ''
-        self.conn.request("PUT", self.data.api, self.data.payload, self.data.header)
-        data = self.url_construct()
+        data = self.url_construct("PUT")
         # data = mock_data1()
-        self.data.stream_state = get_nested_value(data, key_path_state)
+        self.data.stream_state = data.state
         return self.data
 
-    def url_construct(self):
-        res = self.conn.getresponse()
-        data = res.read()
-        return data.decode('utf-8')
+    def delete_live_stream(self, stream_id):
+        # wowza only deletes a stopped stream, one that is already gone counts as deleted
+        self.data.api = f'/api/v2.0/live_streams/{stream_id}'
+        self.data.payload = ''
+        try:
+            self.url_construct("DELETE", response_type=None)
+        except WowzaAPIException as e:
+            if e.status != 404:
+                raise
+
+    def url_construct(self, method, response_type=LiveStreamResponse):
+        # GET and PUT (start/stop) are safe to repeat, a POST is only repeated when wowza refused it with a 429
+        idempotent = method in ('GET', 'PUT', 'DELETE')
+        delays = backoff_delays(maximum=wowza_max_backoff)
+        for attempt in range(1, wowza_max_attempts + 1):
+            trial = wowza_breaker.before_call()
+            last_attempt = attempt == wowza_max_attempts
+            try:
+                res = self.pool.request(method, self.data.api, body=self.data.payload, headers=self.data.header)
+            except transport_errors as e:
+                if isinstance(e, PoolTimeout):
+                    # contention for our own connection pool, wowza was never asked and the request can be resent
+                    wowza_breaker.record_skipped()
+                else:
+                    wowza_breaker.record_failure()
+                if (not idempotent and not isinstance(e, PoolTimeout)) or last_attempt:
+                    raise WowzaAPIException(f"{method} {self.data.api} failed: {str(e)}") from e
+                delay = next(delays)
+                logger.warning(f"{method} {self.data.api} failed ({str(e)}), retrying in {delay:.1f}s")
+                sleep(delay)
+                continue
+            except BaseException:
+                # says nothing about wowza's health, but a trial call must still hand the half open circuit back
+                if trial:
+                    wowza_breaker.record_skipped()
+                raise
+            if res.status == 429 or res.status >= 500:
+                if res.status >= 500:
+                    wowza_breaker.record_failure()
+                else:
+                    # throttling is wowza working as designed, not a sign it is down
+                    wowza_breaker.record_success()
+                retryable = idempotent or res.status == 429
+                delay = max(next(delays), retry_after(res.headers) or 0)
+                if not retryable or last_attempt or delay > wowza_max_backoff:
+                    raise WowzaAPIException(f"{method} {self.data.api} returned {res.status}", status=res.status)
+                logger.warning(f"{method} {self.data.api} returned {res.status}, retrying in {delay:.1f}s")
+                sleep(delay)
+                continue
+            wowza_breaker.record_success()
+            if res.status >= 400:
+                raise WowzaAPIException(f"{method} {self.data.api} returned {res.status}: {res.text()[:200]}",
+                                        status=res.status)
+            return response_type.from_body(res.body) if response_type is not None else None
 
 
 class MultiUserStreamMeta(type):
     # this ensures that each stream of a user has it own instance,which can be accessed if it already exists, hence maximizing resources
+    # _instances is only a per-worker cache of facades, the shared registry holds the stream state every worker sees
     _instances = {}
+    _lock = threading.RLock()
 
     def __call__(cls, *args, **kwargs):
         user_id = kwargs.get('user_id') or args[0]
@@ -209,24 +336,88 @@ class MultiUserStreamMeta(type):
             raise ValueError("object_id must be provided")
         if user_id =='default' and object_id == 'default':
             return super().__call__(*args, **kwargs)
-        key = (user_id, object_id)
-        if key not in cls._instances:
-            logger.info('key not found\nAdding Instance...')
-            cls._instances[key] = super().__call__(*args, **kwargs)
-        logger.info(f'\ninstances:{MultiUserStreamMeta._instances} ')
-        return cls._instances[key]
+        key = (str(user_id), str(object_id))
+        with cls._lock:
+            record = get_registry().get(user_id, object_id)
+            if record is None:
+                logger.info('key not found\nAdding Instance...')
+                instance = super().__call__(*args, **kwargs)
+                cls._instances[key] = instance
+                instance.save()
+                return instance
+            return cls._hydrate(record)
+
+    def _hydrate(cls, record: dict):
+        # reuse the cached facade for this worker but always take the state from the registry
+        key = (str(record['user_id']), str(record['object_id']))
+        with cls._lock:
+            instance = cls._instances.get(key)
+            if instance is None:
+                instance = super().__call__(record['user_id'], record['object_id'])
+                cls._instances[key] = instance
+        # a facade busy with setup/listen/stop is ahead of the registry and saves its own state when done
+        if instance._busy.acquire(blocking=False):
+            try:
+                instance.load_record(record)
+            finally:
+                instance._busy.release()
+        return instance
+
+    def prune_instances(cls) -> int:
+        # drops the facades of streams that left the registry, e.g. evicted by the reaper of another worker, so the
+        # cache of every worker stays as small as the registry
+        with cls._lock:
+            known = {(str(record['user_id']), str(record['object_id'])) for record in get_registry().records()}
+            stale = [key for key in cls._instances if key not in known]
+            for key in stale:
+                del cls._instances[key]
+        return len(stale)
 
 
 class WowzaFacade(metaclass=MultiUserStreamMeta):
-    def __init__(self, user_id: int or str = None, object_id: str = None, cam_angle=None, cam_label=None):
+    # duplicate setup/listen/stop calls for the same stream share one wowza round trip
+    _flights = SingleFlight()
+
+    def __init__(self, user_id: int or str = None, object_id: str = None, cam_angle=None, cam_label=None,
+                 encoding_profile=None, region_hint=None, region_rtts=None):
         self.user_id = user_id
         self.object_id = str(object_id)
         self.client = WowzaClient()
         self.client.data.cam_label = cam_label
         self.client.data.cam_angle = cam_angle
+        self.client.data.encoding_profile = encoding_profile or default_encoding_profile
+        self.client.data.idempotency_key = idempotency_key(self.user_id, self.object_id)
+        # what the streamer told us about its location, only used to pick the broadcast location in setup()
+        self.region_hint: Optional[str] = region_hint
+        self.region_rtts: Optional[dict] = region_rtts
+        # set when the facade is rebuilt from a record that already has a broadcast location
+        self._location_saved = False
         self.initialized = False
+        # provisioning progress: pending -> creating -> initializing -> ready | failed
+        self.status = 'pending'
+        self.status_at: float = time()
+        self.error: Optional[str] = None
+        # wall clock of the last setup/listen/stop, the reaper stops and evicts streams nobody touches
+        self.last_active_at: float = time()
+        self.registered_at: float = self.last_active_at
+        self._busy = threading.RLock()
+
+    def _coalesced(self, operation, fn):
+        def run():
+            with self._busy:
+                return fn()
+        return self._flights.do((operation, str(self.user_id), self.object_id), run)
+
+    def _set_status(self, status, error=None):
+        self.status = status
+        self.status_at = time()
+        self.error = error
+        self.save()
 
     def setup(self):
+        return self._coalesced('setup', self._setup)
+
+    def _setup(self):
         if self.initialized:
             return {
                 'object_id': self.object_id,
@@ -239,10 +430,47 @@ class WowzaFacade(metaclass=MultiUserStreamMeta):
                 'hls':self.client.data.hls,
                 'primary_server':self.client.data.primary_server,
                 'cam_angle': self.client.data.cam_angle,
-                'cam_label': self.client.data.cam_label
+                'cam_label': self.client.data.cam_label,
+                'encoding_profile': self.client.data.encoding_profile,
+                'broadcast_location': self.client.data.broadcast_location
             }
+        started_at = monotonic()
+        lease = setup_lease_name(self.user_id, self.object_id)
+        if not get_registry().try_lease(lease, str(os.getpid()), setup_lease_ttl):
+            return self._wait_for_remote_setup()
         try:
-            start_stream = self.client.create_live_stream()
+            # a retried setup runs on a facade rebuilt from its record, which keeps the location picked the first time
+            if self.region_hint is not None or self.region_rtts or not self._location_saved:
+                self.client.data.broadcast_location = region_selector.select(self.region_hint, self.region_rtts)
+            # spares are created with the default profile and location, other streams always get one of their own
+            if (warm_pool_size > 0 and self.client.data.encoding_profile == default_encoding_profile
+                    and self.client.data.broadcast_location == default_broadcast_location
+                    and self._claim_warm_stream()):
+                self._record_time_to_ready('warm', started_at)
+                logger.info(f"Stream {self.object_id} set up from the warm pool")
+                return self._setup()
+            return self._create_stream(started_at)
+        finally:
+            get_registry().release_lease(lease, str(os.getpid()))
+
+    def _wait_for_remote_setup(self, poll_interval=1):
+        # another worker is creating this stream, wait for its result instead of creating a second one
+        deadline = monotonic() + setup_lease_ttl
+        while monotonic() < deadline:
+            record = get_registry().get(self.user_id, self.object_id)
+            if record is not None and record.get('status') in ('ready', 'failed'):
+                self.load_record(record)
+                return self.to_dict() if self.initialized else 'failed'
+            sleep(poll_interval)
+        return 'failed'
+
+    def _create_stream(self, started_at):
+        try:
+            # saved before the request, a setup retried after a failure or a crash then looks for the stream first
+            retried = self.client.data.create_attempted
+            self.client.data.create_attempted = True
+            self._set_status('creating')
+            start_stream = self.client.create_live_stream(lookup_first=retried)
             self.client.data.stream_id = start_stream.stream_id
             self.client.data.stream_name = start_stream.stream_name
             self.client.data.stream_state = start_stream.state
@@ -253,28 +481,20 @@ class WowzaFacade(metaclass=MultiUserStreamMeta):
             self.client.data.primary_server = start_stream.primary_server
         except Exception as e:
             logger.error(f"Problem with creating live stream: {str(e)}")
+            self._set_status('failed', str(e))
             return 'failed'
         try:
-            initialize_stream = self.client.initialize_live_stream(stream_id=self.client.data.stream_id)
-            embed_code = initialize_stream.embed_code
-
-            retries:int = 0
-            while embed_code == 'in_progress':
-                # takes a while to get initialized in the wowza server
-                sleep(2)
-                print('Waiting for stream to initialize...')
-                initialize_stream = self.client.initialize_live_stream(stream_id=self.client.data.stream_id)
-
-                # embed_code = get_nested_value(initialize_stream, key_path_embed_code)
-                embed_code = initialize_stream.embed_code
-                retries += 1
-                if retries > 10:
-                    logger.error("Max retries reached while waiting for stream initialization")
-                    return 'failed'
-
+            self._set_status('initializing')
+            embed_code = self.client.wait_until_initialized(stream_id=self.client.data.stream_id)
+            if embed_code is None:
+                logger.error("Max retries reached while waiting for stream initialization")
+                self._set_status('failed', 'Max retries reached while waiting for stream initialization')
+                return 'failed'
 
             self.client.data.embed_code = embed_code
             self.initialized = True
+            self._set_status('ready')
+            self._record_time_to_ready('cold', started_at)
             logger.info(f"Stream initialized with embed code: {self.client.data.embed_code}")
             return {
                 'object_id': self.object_id,
@@ -287,61 +507,142 @@ class WowzaFacade(metaclass=MultiUserStreamMeta):
                 'hls':self.client.data.hls,
                 'primary_server':self.client.data.primary_server,
                 'cam_angle': self.client.data.cam_angle,
-                'cam_label': self.client.data.cam_label
+                'cam_label': self.client.data.cam_label,
+                'encoding_profile': self.client.data.encoding_profile,
+                'broadcast_location': self.client.data.broadcast_location
             }
         except Exception as e:
             logger.error(f"Error during stream initialization: {str(e)}")
+            self._set_status('failed', str(e))
             return 'failed'
 
+    def _claim_warm_stream(self) -> bool:
+        spare = get_registry().claim_spare(warm_pool_name)
+        get_registry().incr_counter('warm_pool.hits' if spare else 'warm_pool.misses')
+        if spare is None:
+            return False
+        for field in ('stream_id', 'stream_name', 'username', 'password', 'embed_code', 'hls', 'primary_server'):
+            setattr(self.client.data, field, spare[field])
+        self.client.data.stream_state = spare['state']
+        self.initialized = True
+        self._set_status('ready')
+        return True
+
+    @staticmethod
+    def _record_time_to_ready(source, started_at):
+        registry = get_registry()
+        registry.incr_counter(f'time_to_ready.{source}.count')
+        registry.incr_counter(f'time_to_ready.{source}.seconds', monotonic() - started_at)
+
     def listen_to_stream(self):
-        try:
-            listen = self.client.start_listening_to_stream(stream_id=self.client.data.stream_id)
-            stream_state = listen.stream_state
-            print(stream_state)
-            if stream_state == 'starting':
-                self.client.data.stream_state = True
-                return {'state': self.client.data.stream_state}
-            # raise a custom error
-        except Exception:
-            ...
-
-    def stop_stream(self):
-        try:
-            stop = self.client.stop_listening_to_stream(stream_id=self.client.data.stream_id)
-            stream_state = stop.stream_state
-            if stream_state == 'stopped':
-                self.client.data.stream_state = False
-                return {'state': self.client.data.stream_state}
-        except Exception:
-            ...
+        return self._coalesced('listen', self._listen_to_stream)
+
+    def _listen_to_stream(self):
+        # failures raise, a CircuitOpenError while wowza is failing fast and a WowzaAPIException otherwise
+        listen = self.client.start_listening_to_stream(stream_id=self.client.data.stream_id)
+        stream_state = listen.stream_state
+        if stream_state != 'starting':
+            raise WowzaAPIException(f"Stream {self.object_id} did not start, wowza reported {stream_state}")
+        self.client.data.stream_state = True
+        self.save()
+        return {'state': self.client.data.stream_state}
+
+    def stop_stream(self, touch: bool = True):
+        # the reaper and the on-demand loop stop streams with touch=False, a stop nobody asked for is not activity
+        return self._coalesced('stop', lambda: self._stop_stream(touch))
+
+    def _stop_stream(self, touch: bool = True):
+        stop = self.client.stop_listening_to_stream(stream_id=self.client.data.stream_id)
+        stream_state = stop.stream_state
+        if stream_state != 'stopped':
+            raise WowzaAPIException(f"Stream {self.object_id} did not stop, wowza reported {stream_state}")
+        self.client.data.stream_state = False
+        self.save(touch=touch)
+        return {'state': self.client.data.stream_state}
+
+    @classmethod
+    def _for_all_user_streams(cls, user_id, action, active: bool) -> dict:
+        # fans one facade method out over every initialized stream of the user that is not already in the wanted
+        # state, over the shared connection pool; nothing left to do counts as success
+        instances = [cls._hydrate(record) for record in get_registry().user_records(user_id)
+                     if record['initialized'] and is_active(record) is not active]
+        if not instances:
+            return {'status': 'success', 'results': {}, 'failed': []}
+        def attempt(instance):
+            # one stream failing must not lose the results of the others, it is reported in failed
+            try:
+                return action(instance)
+            except Exception as e:
+                logger.error(f"{action.__name__} failed for stream {instance.object_id}: {str(e)}")
+
+        with ThreadPoolExecutor(max_workers=min(len(instances), bulk_concurrency),
+                                thread_name_prefix='wowza-bulk') as executor:
+            results = dict(zip([instance.object_id for instance in instances],
+                               executor.map(attempt, instances)))
+        failed = [object_id for object_id, result in results.items() if result is None]
+        status = 'success' if not failed else 'partial' if len(failed) < len(results) else 'failed'
+        return {'status': status, 'results': results, 'failed': failed}
+
+    @classmethod
+    def start_all(cls, user_id) -> dict:
+        return cls._for_all_user_streams(user_id, cls.listen_to_stream, active=True)
+
+    @classmethod
+    def stop_all(cls, user_id) -> dict:
+        return cls._for_all_user_streams(user_id, cls.stop_stream, active=False)
 
     @classmethod
     def delete_instance(cls,user_id,object_id):
-        key = (user_id,object_id)
-        if key in MultiUserStreamMeta._instances:
-            del MultiUserStreamMeta._instances[key]
+        with MultiUserStreamMeta._lock:
+            get_registry().delete(user_id, object_id)
+            MultiUserStreamMeta._instances.pop((str(user_id), str(object_id)), None)
         return {'status': 'deleted'}
 
     @classmethod
     def get_unique_user_ids(cls)-> set[str]:
         # Returns a set of unique user IDs
-        return {uid for (uid, _) in MultiUserStreamMeta._instances.keys()}
+        return get_registry().user_ids()
 
     @classmethod
     def get_users_with_active_streams(cls) -> set:
-        return {uid for (uid, _), instance in MultiUserStreamMeta._instances.items() if
-                instance.client.data.stream_state == True}
+        return get_registry().active_user_ids()
 
     @classmethod
     def get_instances_by_stream_state(cls, state):
-        return [instance for instance in MultiUserStreamMeta._instances.values() if instance.stream_state == state]
+        return [cls._hydrate(record) for record in get_registry().records_by_state(state)]
 
     @classmethod
     def get_user_instances(cls, user_id):
         # returns different facade instances
         # facade_instances_list[index].method/property
 
-        return [instance for (uid, _), instance in MultiUserStreamMeta._instances.items() if uid == user_id]
+        return [cls._hydrate(record) for record in get_registry().user_records(user_id)]
+
+    def save(self, touch: bool = True):
+        if touch:
+            self.last_active_at = time()
+        get_registry().put(self.to_record())
+
+    def to_record(self):
+        return {'user_id': self.user_id, 'initialized': self.initialized, 'error': self.error,
+                'last_active_at': self.last_active_at, 'registered_at': self.registered_at,
+                'status_at': self.status_at,
+                'create_attempted': self.client.data.create_attempted, **self.to_dict()}
+
+    def load_record(self, record: dict):
+        self.initialized = record['initialized']
+        self.status = record.get('status', 'ready' if self.initialized else 'pending')
+        self.error = record.get('error')
+        self.status_at = record.get('status_at', record.get('last_active_at', self.status_at))
+        self.last_active_at = record.get('last_active_at', self.last_active_at)
+        self.registered_at = record.get('registered_at', 0)
+        for field in ('stream_id', 'stream_name', 'stream_state', 'username', 'password', 'embed_code', 'hls',
+                      'primary_server', 'cam_angle', 'cam_label'):
+            setattr(self.client.data, field, record[field])
+        self.client.data.encoding_profile = record.get('encoding_profile') or default_encoding_profile
+        self.client.data.broadcast_location = record.get('broadcast_location') or default_broadcast_location
+        self._location_saved = record.get('broadcast_location') is not None
+        self.client.data.create_attempted = record.get('create_attempted', False)
 
     def to_dict(self):
         return {
@@ -355,5 +656,8 @@ class WowzaFacade(metaclass=MultiUserStreamMeta):
             'hls':self.client.data.hls,
             'primary_server':self.client.data.primary_server,
             'cam_angle': self.client.data.cam_angle,
-            'cam_label': self.client.data.cam_label
+            'cam_label': self.client.data.cam_label,
+            'encoding_profile': self.client.data.encoding_profile,
+            'broadcast_location': self.client.data.broadcast_location,
+            'status': self.status
         }
\ No newline at end of file